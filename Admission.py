@@ -0,0 +1,133 @@
+""" The Admission Control for Edge Fair Scheduler
+
+This class decides whether new jobs are let into the job queue
+before any work is done on the database. The depth of the queue is
+read from the in-memory job queue of the scheduler along with the
+jobs admitted but not yet queued, so it costs nothing to check. Each
+client, named by the common name of its certificate, may only have
+so many jobs queued and submits jobs through a token bucket, so one
+client cannot flood the queue. Refused jobs are given a hint of how
+long to wait before trying again.
+"""
+
+import threading
+import time
+from collections import Counter
+
+
+class Admission:
+
+    def __init__(self, queue, maxQueue, clientQueue=0, clientRate=0.0, clientBurst=1, retryAfter=5.0,
+                 clock=time.monotonic):
+        """Variable initialisation for the class
+
+        Parameters:
+            queue (JobQueue): The job queue of the scheduler
+            maxQueue (int): The maximum number of queued jobs
+            clientQueue (int): The maximum number of queued jobs per client
+                (default is 0 which sets no limit)
+            clientRate (float): The number of jobs per second each client may submit on average
+                (default is 0.0 which sets no limit)
+            clientBurst (int): The number of jobs each client may submit at once
+                (default is 1)
+            retryAfter (float): The number of seconds a client refused for lack of space is told to wait
+                (default is 5.0)
+            clock (function): Returns the current time in seconds
+                (default is time.monotonic)
+
+        """
+
+        self.queue = queue
+        self.maxQueue = maxQueue
+        self.clientQueue = clientQueue
+        self.clientRate = clientRate
+        self.clientBurst = max(clientBurst, 1)
+        self.retryAfter = retryAfter
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        # jobs admitted which are yet to reach the job queue, in total and per client
+        self.pending = 0
+        self.client_pending = Counter()
+
+        # tokens left in the bucket of each client and the time it was last topped up
+        self.tokens = {}
+        self.updated = {}
+
+    def refill(self, client, now):
+        """Tops up the token bucket of a client for the time passed since it was last topped up
+
+        Parameters:
+            client (str): Name of the client
+            now (float): The current time in seconds
+
+        Returns:
+            float: The tokens in the bucket
+
+        """
+
+        tokens = self.tokens.get(client, self.clientBurst)
+        tokens = min(tokens + (now - self.updated.get(client, now)) * self.clientRate, self.clientBurst)
+        self.tokens[client] = tokens
+        self.updated[client] = now
+        return tokens
+
+    def admit(self, client, count=1):
+        """Admits as many of a number of jobs of a client as the limits allow, the admitted jobs
+        count towards the limits until they are released
+
+        Parameters:
+            client (str): Name of the client
+            count (int): Number of jobs
+                (default is 1)
+
+        Returns:
+            tuple: The number of jobs admitted, and None if all were admitted or otherwise the reason the
+            rest were refused, the number of seconds to wait before trying again and the kind of refusal
+
+        """
+
+        with self.lock:
+            # space left in the job queue, jobs are accepted for as long as no more than maxQueue are queued
+            space = self.maxQueue + 1 - len(self.queue) - self.pending
+            refusal = ('No space in job queue', self.retryAfter, 'queue_full')
+
+            if self.clientQueue > 0:
+                quota = self.clientQueue - self.queue.size(client) - self.client_pending[client]
+                if quota < space:
+                    space = quota
+                    refusal = ('Too many jobs queued by the client', self.retryAfter, 'client_quota')
+
+            if self.clientRate > 0:
+                tokens = self.refill(client, self.clock())
+                if int(tokens) < space:
+                    space = int(tokens)
+                    refusal = ('Jobs submitted too quickly', None, 'rate_limited')
+
+            admitted = max(min(space, count), 0)
+            if refusal[1] is None:
+                # time until there are tokens for the jobs refused, or for as many as the bucket holds
+                missing = min(count - admitted, self.clientBurst) - (tokens - admitted)
+                refusal = (refusal[0], missing / self.clientRate, refusal[2])
+            if self.clientRate > 0:
+                self.tokens[client] -= admitted
+            self.pending += admitted
+            self.client_pending[client] += admitted
+
+        return admitted, (refusal if admitted < count else None)
+
+    def release(self, client, count=1):
+        """Releases admitted jobs once they have been added to the job queue, or have failed to be
+
+        Parameters:
+            client (str): Name of the client
+            count (int): Number of jobs
+                (default is 1)
+
+        """
+
+        with self.lock:
+            self.pending -= count
+            self.client_pending[client] -= count
+            if self.client_pending[client] <= 0:
+                del self.client_pending[client]
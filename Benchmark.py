@@ -0,0 +1,272 @@
+""" The Scheduler Benchmark for Edge Fair Scheduler
+
+This script measures how fast the Scheduler selects jobs with each
+of the scheduling strategies, at a range of queue depths, numbers of
+clients and sizes of the jobs history. Each scenario runs against a
+temporary SQLite database and a stub container registry, so neither
+Docker nor edge.db are needed. The results are written as JSON, and
+can be compared with the results of an earlier run to catch any
+regressions in the job selection.
+
+Usage:
+    python Benchmark.py --output results.json [--compare baseline.json]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from Database import Database
+from Migrations import migrate
+from Scheduler import Scheduler
+
+# the strategies the Scheduler ships with
+STRATEGIES = ['fcfs', 'client', 'priority', 'hybrid']
+
+
+class StubRegistry:
+    """Stands in for the container registry, reporting no running containers"""
+
+    def __init__(self):
+        self.dockr = None
+        self.ready = threading.Event()
+        self.ready.set()
+
+    def subscribe(self, listener):
+        pass
+
+    def containers(self):
+        return []
+
+
+def build_database(path, depth, clients, history, seed):
+    """Creates a database holding a job queue and jobs history
+
+    Parameters:
+        path (str): Path of the database
+        depth (int): Number of queued jobs
+        clients (int): Number of clients
+        history (int): Number of jobs run within the fairness window
+        seed (int): Seed of the random generator
+
+    """
+
+    rng = random.Random(seed)
+    now = datetime.datetime.utcnow()
+    names = ['client{}'.format(i) for i in range(clients)]
+
+    def row(age):
+        timestamp = (now - datetime.timedelta(seconds=age)).strftime('%Y-%m-%d %H:%M:%S')
+        return rng.choice(names), '127.0.0.1', 5000, rng.choice((1, 2, 3)), timestamp, '80'
+
+    db = sqlite3.connect(path)
+    migrate(db)
+    cur = db.cursor()
+
+    # jobs run over the last week, numbered as if they had gone through the job queue
+    cur.executemany("INSERT INTO jobs (id, cust_name, cust_ip, cust_port, priority, timestamp, ports) "
+                    "VALUES (?,?,?,?,?,?,?)",
+                    ((1001 + i,) + row(rng.uniform(0, 6.5 * 86400)) for i in range(history)))
+    cur.execute("UPDATE SQLITE_SEQUENCE SET seq=? WHERE name='job_queue'", (1000 + history,))
+
+    # jobs queued over the last hour
+    cur.executemany("INSERT INTO job_queue (cust_name, cust_ip, cust_port, priority, timestamp, ports) "
+                    "VALUES (?,?,?,?,?,?)", (row(rng.uniform(0, 3600)) for _ in range(depth)))
+    db.commit()
+    db.close()
+
+
+def create_scheduler(strategy, path):
+    """Creates a Scheduler with its job queue and fair share index loaded from a database
+
+    Parameters:
+        strategy (str): The scheduling strategy
+        path (str): Path of the database
+
+    Returns:
+        tuple: The Scheduler and the time taken to load it in seconds
+    """
+
+    scheduler = Scheduler(maxJobs=1000000, unitCPU=50000, unitMem=256, maxCPU=100000, portUpper=65000,
+                          portLower=60000, strategy=strategy, registry=StubRegistry(), database=Database(path))
+
+    start = time.perf_counter()
+    with scheduler.database.cursor() as cur, scheduler.queue.lock:
+        scheduler.fair_share.rebuild(cur)
+        scheduler.queue.load(cur)
+    return scheduler, time.perf_counter() - start
+
+
+def percentile(values, p):
+    """Gets a percentile of a list of values
+
+    Parameters:
+        values (list): The sorted values
+        p (float): The percentile, between 0 and 100
+
+    Returns:
+        float: The value at the percentile
+    """
+
+    if len(values) == 0:
+        return 0.0
+    return values[min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)]
+
+
+def run_scenario(strategy, path, decisions, batch):
+    """Measures the job selection of a strategy against a database
+
+    Parameters:
+        strategy (str): The scheduling strategy
+        path (str): Path of the database, which is left unchanged
+        decisions (int): Maximum number of decisions to time
+        batch (int): Number of jobs claimed together when timing the claims
+
+    Returns:
+        dict: The measurements
+    """
+
+    # work on a copy so every strategy starts from the same queue
+    copy = path + '.' + strategy
+    shutil.copyfile(path, copy)
+    scheduler, load = create_scheduler(strategy, copy)
+
+    # time each decision, which selects a job with the policy and takes it from the queue
+    latencies = []
+    with scheduler.queue.lock:
+        while len(latencies) < decisions and len(scheduler.queue) > 0:
+            start = time.perf_counter()
+            job = scheduler.policy.select(scheduler.queue, scheduler.fair_share)
+            scheduler.queue.take(job[0])
+            latencies.append(time.perf_counter() - start)
+
+    # time the claims, which also move the jobs to the jobs history table
+    claims = []
+    for _ in range(5):
+        if len(scheduler.queue) == 0:
+            break
+        start = time.perf_counter()
+        claimed = scheduler.claim_jobs(batch)
+        claims.append((time.perf_counter() - start) / max(len(claimed), 1))
+
+    scheduler.database.close()
+    scheduler.provisioners.shutdown()
+    os.remove(copy)
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'decisions': len(latencies),
+        'decisions_per_sec': len(latencies) / total if total > 0 else 0.0,
+        'p50_us': percentile(latencies, 50) * 1e6,
+        'p99_us': percentile(latencies, 99) * 1e6,
+        'max_us': (latencies[-1] if latencies else 0.0) * 1e6,
+        'load_ms': load * 1e3,
+        'claim_us_per_job': (sum(claims) / len(claims) if claims else 0.0) * 1e6,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Compares results against those of an earlier run
+
+    Parameters:
+        results (list): The results of this run
+        baseline (list): The results of the earlier run
+        tolerance (float): The factor by which the p99 latency may grow before it counts as a regression
+
+    Returns:
+        list: Descriptions of the regressions found
+    """
+
+    def key(r):
+        return r['strategy'], r['depth'], r['clients'], r['history']
+
+    earlier = {key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = earlier.get(key(r))
+        if b is None or b['p99_us'] <= 0:
+            continue
+        ratio = r['p99_us'] / b['p99_us']
+        print('{:<8} depth={:<7} clients={:<5} history={:<7} p99 {:9.1f}us -> {:9.1f}us ({:.2f}x)'.format(
+            r['strategy'], r['depth'], r['clients'], r['history'], b['p99_us'], r['p99_us'], ratio))
+        if ratio > tolerance:
+            regressions.append('{} depth={} clients={} history={}: p99 {:.2f}x slower'.format(*key(r) + (ratio,)))
+    return regressions
+
+
+def parse_list(value):
+    """Parses a list of values separated by commas
+
+    Parameters:
+        value (str): The values
+
+    Returns:
+        list: The values, as integers where possible
+    """
+
+    items = [v.strip() for v in value.split(',') if v.strip()]
+    return [int(v) if v.isdigit() else v for v in items]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the job selection of the EFS Scheduler')
+    parser.add_argument('--strategies', type=parse_list, default=STRATEGIES)
+    parser.add_argument('--depths', type=parse_list, default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument('--clients', type=parse_list, default=[10, 100])
+    parser.add_argument('--history', type=parse_list, default=[0, 10000])
+    parser.add_argument('--decisions', type=int, default=1000, help='maximum decisions timed per scenario')
+    parser.add_argument('--batch', type=int, default=100, help='jobs claimed together when timing claims')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='p99 slowdown factor which counts as a regression (default 1.5)')
+    args = parser.parse_args(argv)
+
+    results = []
+    folder = tempfile.mkdtemp(prefix='efs_bench_')
+    try:
+        for depth in args.depths:
+            for clients in args.clients:
+                for history in args.history:
+                    path = os.path.join(folder, 'bench.db')
+                    build_database(path, depth, clients, history, args.seed)
+
+                    for strategy in args.strategies:
+                        r = {'strategy': strategy, 'depth': depth, 'clients': clients, 'history': history}
+                        r.update(run_scenario(strategy, path, args.decisions, args.batch))
+                        results.append(r)
+                        print('{:<8} depth={:<7} clients={:<5} history={:<7} {:10.0f}/s p50 {:8.1f}us '
+                              'p99 {:8.1f}us'.format(strategy, depth, clients, history, r['decisions_per_sec'],
+                                                     r['p50_us'], r['p99_us']))
+                    os.remove(path)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump({'python': platform.python_version(), 'platform': platform.platform(),
+                   'created': datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, f,
+                  indent=2)
+    print('Results written to {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        for r in regressions:
+            print('Regression: {}'.format(r))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
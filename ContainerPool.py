@@ -0,0 +1,200 @@
+""" The Container Pool for Edge Fair Scheduler
+
+This class keeps a number of containers created ahead of time so
+jobs can be started without waiting for Docker to create and start
+a container. Pooled containers have the CPU and RAM limits of a job,
+ports mapped for the configured set of job ports and are kept paused
+until the scheduler claims one for a job. The pool is topped up in
+the background whenever the job limit leaves room for it.
+"""
+
+import threading
+import uuid
+import docker
+from collections import deque
+from Metrics import DOCKER_ERRORS
+
+
+class ContainerPool(threading.Thread):
+
+    # prefix of the names of the pooled containers, job containers are named after the job ID
+    PREFIX = 'efs_pool_'
+
+    def __init__(self, dockr, ports, size, jobPorts, capacity, **create_args):
+        """Variable initialisation for the class
+
+        Parameters:
+            dockr (DockerClient): Docker client
+            ports (PortAllocator): Allocator of the host ports
+            size (int): The number of containers to keep in the pool
+            jobPorts (str): List of ports the pooled containers map, separated by commas
+            capacity (function): Returns the number of containers which can still be started
+            create_args: Arguments used to create the containers
+
+        """
+
+        super(ContainerPool, self).__init__(daemon=True)
+        self.stopRequest = threading.Event()
+        self.replenishRequest = threading.Event()
+        self.lock = threading.Lock()
+
+        self.dockr = dockr
+        self.ports = ports
+        self.size = size
+        self.capacity = capacity
+        self.create_args = create_args
+
+        # the ports every pooled container maps, plus 22 to allow ssh access
+        self.req_ports = [p.strip() for p in jobPorts.split(',') if p.strip()]
+        self.req_ports.append('22')
+
+        # paused containers ready to be claimed along with their port mappings
+        self.containers = deque()
+
+        # names of the pooled containers including those still being created
+        self.names = set()
+
+    def __len__(self):
+        return len(self.containers)
+
+    def matches(self, ports):
+        """Checks if a job needs the ports the pooled containers map
+
+        Parameters:
+            ports (str): List of required ports separated by commas
+
+        Returns:
+            bool: True/False whether a pooled container can be used
+
+        """
+
+        return [p.strip() for p in ports.split(',') if p.strip()] + ['22'] == self.req_ports
+
+    def create_container(self):
+        """Creates a container and adds it to the pool paused
+
+        Returns:
+            bool: True/False whether the container was created
+
+        """
+
+        name = self.PREFIX + uuid.uuid4().hex[:12]
+        with self.lock:
+            self.names.add(name)
+
+        container = None
+        free_ports = self.ports.allocate(name, len(self.req_ports))
+        try:
+            if free_ports is None:
+                return False
+            mapped_ports = dict(zip(self.req_ports, free_ports))
+
+            container = self.dockr.containers.run(name=name, ports=mapped_ports, detach=True, **self.create_args)
+            container.pause()
+
+            with self.lock:
+                self.containers.append((container, mapped_ports))
+            return True
+        except docker.errors.APIError as e:
+            DOCKER_ERRORS.inc('pool')
+            print("Unable to create pooled container: {}".format(e))
+            self.discard(name, container)
+            return False
+
+    def discard(self, name, container):
+        """Removes a container which will not be used and releases its ports
+
+        Parameters:
+            name (str): Name the ports are reserved under
+            container (Container): The container or None if it was not created
+
+        """
+
+        if container is not None:
+            try:
+                container.remove(force=True)
+            except docker.errors.APIError:
+                pass  # already gone
+
+        self.ports.release(name)
+        with self.lock:
+            self.names.discard(name)
+
+    def claim(self, job_id, ports):
+        """Claims a pooled container for a job, renaming it to the job ID and unpausing it
+
+        Parameters:
+            job_id (int): The ID of the job
+            ports (str): List of ports required by the job separated by commas
+
+        Returns:
+            tuple/None: The container and its port mappings or None if no pooled container can be used
+
+        """
+
+        if not self.matches(ports):
+            return None
+
+        with self.lock:
+            if len(self.containers) == 0:
+                return None
+            container, mapped_ports = self.containers.popleft()
+
+        # the freed up place in the pool is filled in the background
+        self.replenishRequest.set()
+
+        name = container.name
+        try:
+            container.rename(str(job_id))
+            container.unpause()
+        except docker.errors.APIError as e:
+            DOCKER_ERRORS.inc('pool')
+            print("Unable to claim pooled container: {}".format(e))
+            self.discard(name, container)
+            return None
+
+        # the ports are now reserved for the job
+        self.ports.transfer(name, str(job_id))
+        with self.lock:
+            self.names.discard(name)
+        return container, mapped_ports
+
+    def evict(self):
+        """Removes one pooled container to make room for a job which cannot use the pool"""
+
+        with self.lock:
+            if len(self.containers) == 0:
+                return
+            container, mapped_ports = self.containers.pop()
+
+        self.discard(container.name, container)
+
+    def drain(self):
+        """Removes all pooled containers"""
+
+        with self.lock:
+            containers = list(self.containers)
+            self.containers.clear()
+
+        for container, mapped_ports in containers:
+            self.discard(container.name, container)
+
+    def run(self):
+        """Keeps the pool topped up for as long as the job limit allows"""
+
+        while not self.stopRequest.is_set():
+            while len(self.containers) < self.size and self.capacity() > 0 and not self.stopRequest.is_set():
+                if not self.create_container():
+                    break
+
+            # wait for a container to be claimed, or retry after a while if the pool could not be filled
+            self.replenishRequest.wait(10)
+            self.replenishRequest.clear()
+
+    def join(self, timeout=None):
+        """Called when the EFS is being shut down, stopping the Thread and removing the pooled containers"""
+
+        self.stopRequest.set()
+        self.replenishRequest.set()
+        super(ContainerPool, self).join(timeout)
+        self.drain()
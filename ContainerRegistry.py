@@ -0,0 +1,217 @@
+""" The Container Registry for Edge Fair Scheduler
+
+This class keeps an in-memory record of the running containers, their
+ports and limits, which the scheduler and monitor read instead of
+asking Docker. The record is built from a full listing when the
+registry starts and is then kept up to date from the Docker events
+stream. Should the stream drop, the registry reconnects and rebuilds
+the record, so no changes are missed.
+"""
+
+import threading
+import docker
+import requests
+from collections import namedtuple
+from Metrics import DOCKER_ERRORS, DOCKER_RECONNECTS
+
+# the record kept of each running container
+ContainerInfo = namedtuple('ContainerInfo', ['id', 'name', 'ports', 'status', 'cpu_quota', 'mem_limit'])
+
+
+class ContainerRegistry(threading.Thread):
+
+    def __init__(self, retryInterval=1.0):
+        """Variable initialisation for the class
+
+        Parameters:
+            retryInterval (float): The number of seconds to wait before reconnecting to Docker
+                (default is 1.0)
+
+        """
+
+        super(ContainerRegistry, self).__init__(daemon=True)
+        self.stopRequest = threading.Event()
+        self.ready = threading.Event()  # set once the first listing has been loaded
+        self.retryInterval = retryInterval
+        self.lock = threading.Lock()
+
+        # Docker client shared by all EFS components
+        self.dockr = docker.from_env()
+        self.stream = None
+
+        # running containers keyed by container ID
+        self.records = {}
+
+        # functions called with the event action and container record whenever a container changes
+        self.listeners = []
+
+    def subscribe(self, listener):
+        """Registers a function to be called whenever a container changes
+
+        Parameters:
+            listener (function): Called with the event action and the container record
+
+        """
+
+        self.listeners.append(listener)
+
+    def containers(self):
+        """Gets the running containers, including paused ones
+
+        Returns:
+            list: The container records
+
+        """
+
+        with self.lock:
+            return list(self.records.values())
+
+    def get(self, name):
+        """Gets a running container by name
+
+        Parameters:
+            name (str): Name of the container
+
+        Returns:
+            ContainerInfo/None: The container record or None if no such container is running
+
+        """
+
+        with self.lock:
+            for c in self.records.values():
+                if c.name == name:
+                    return c
+        return None
+
+    def inspect(self, container_id):
+        """Builds the record of a container from its details
+
+        Parameters:
+            container_id (str): ID of the container
+
+        Returns:
+            ContainerInfo/None: The container record or None if the container is not running
+        """
+
+        try:
+            attrs = self.dockr.api.inspect_container(container_id)
+        except docker.errors.NotFound:
+            return None
+
+        state = attrs['State']
+        if not state.get('Running'):
+            return None
+
+        # host ports of all the port mappings
+        ports = []
+        for bindings in (attrs['NetworkSettings'].get('Ports') or {}).values():
+            for b in bindings or []:
+                if b.get('HostPort'):
+                    ports.append(int(b['HostPort']))
+
+        host_config = attrs.get('HostConfig') or {}
+        return ContainerInfo(attrs['Id'], attrs['Name'].lstrip('/'), sorted(set(ports)),
+                             'paused' if state.get('Paused') else 'running', host_config.get('CpuQuota'),
+                             host_config.get('Memory'))
+
+    def track(self, container_id):
+        """Records a container straight away rather than waiting for its event, used by EFS
+        for the containers it starts
+
+        Parameters:
+            container_id (str): ID of the container
+
+        """
+
+        info = self.inspect(container_id)
+        if info is not None:
+            with self.lock:
+                self.records[container_id] = info
+
+    def resync(self):
+        """Rebuilds the record of the running containers from a full listing"""
+
+        records = {}
+        for c in self.dockr.api.containers():
+            info = self.inspect(c['Id'])
+            if info is not None:
+                records[info.id] = info
+
+        with self.lock:
+            self.records = records
+
+        for listener in self.listeners:
+            listener('resync', None)
+
+    def handle(self, event):
+        """Updates the record from a container event
+
+        Parameters:
+            event (dict): The Docker event
+
+        """
+
+        action = event.get('Action', '')
+        container_id = event['Actor']['ID']
+        attributes = event['Actor'].get('Attributes') or {}
+
+        if action == 'start':
+            info = self.inspect(container_id)
+            if info is None:
+                return
+            with self.lock:
+                self.records[container_id] = info
+        elif action in ('die', 'destroy'):
+            with self.lock:
+                info = self.records.pop(container_id, None)
+            if info is None:
+                return
+        elif action in ('pause', 'unpause', 'rename'):
+            with self.lock:
+                info = self.records.get(container_id)
+                if info is None:
+                    return
+                if action == 'rename':
+                    info = info._replace(name=attributes.get('name', info.name))
+                else:
+                    info = info._replace(status='paused' if action == 'pause' else 'running')
+                self.records[container_id] = info
+        elif action == 'oom':
+            print("Container {} ran out of memory".format(attributes.get('name', container_id)))
+            return
+        else:
+            return  # no change to the running containers
+
+        for listener in self.listeners:
+            listener(action, info)
+
+    def run(self):
+        """Follows the Docker events stream, reconnecting and resyncing whenever it drops"""
+
+        while not self.stopRequest.is_set():
+            try:
+                # listen before listing so no event is missed in between
+                self.stream = self.dockr.api.events(decode=True, filters={'type': 'container'})
+                self.resync()
+                self.ready.set()
+
+                for event in self.stream:
+                    self.handle(event)
+            except (docker.errors.APIError, requests.exceptions.RequestException, OSError) as e:
+                if isinstance(e, docker.errors.APIError):
+                    DOCKER_ERRORS.inc('registry')
+                if not self.stopRequest.is_set():
+                    print("Lost the Docker events stream: {}".format(e))
+
+            if not self.stopRequest.is_set():
+                DOCKER_RECONNECTS.inc()
+
+            self.stopRequest.wait(self.retryInterval)
+
+    def join(self, timeout=None):
+        """Called when the EFS is being shut down, stopping the Thread safely"""
+
+        self.stopRequest.set()
+        if self.stream is not None:
+            self.stream.close()
+        super(ContainerRegistry, self).join(timeout)
@@ -0,0 +1,441 @@
+""" The Database for Edge Fair Scheduler
+
+This class is the single point of access to the EFS database. All
+changes to the database are handed to a single writer thread, which
+applies whatever changes are pending in one transaction, so a burst
+of requests shares a single commit rather than each waiting on a
+commit and lock of its own. Callers are handed a future which is
+resolved once their change has been committed. Reads are served
+from a bounded pool of long-lived connections, so the statements
+each connection has prepared are reused rather than compiled for
+every request. The database is run in WAL mode, in which readers do
+not block the writer nor the writer the readers.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from Migrations import migrate
+
+# durability of the commits, from the sqlite synchronous settings
+#   full   - every commit is synced to storage before it is acknowledged
+#   normal - commits are synced at WAL checkpoints, the last commits can be lost on power loss but never corrupted
+#   off    - syncing is left to the operating system
+SYNC_MODES = ('full', 'normal', 'off')
+
+# statements run on the hot paths of the scheduler and monitor, each of which must be served by an index
+SELECT_QUEUED_JOB = "SELECT * FROM job_queue WHERE id=?"
+SELECT_QUEUED_JOBS = "SELECT * FROM job_queue WHERE id BETWEEN ? AND ? ORDER BY id"
+DELETE_QUEUED_JOB = "DELETE FROM job_queue WHERE id=?"
+CLAIM_JOB = "INSERT INTO jobs SELECT * FROM job_queue WHERE id=?"
+DELETE_TERMINATION = "DELETE FROM term_queue WHERE job_id=?"
+SELECT_HISTORY_DAYS = "SELECT DISTINCT date(timestamp) FROM jobs WHERE timestamp<? ORDER BY 1"
+SELECT_HISTORY = "SELECT * FROM jobs WHERE timestamp>=? AND timestamp<date(?, '+1 day')"
+HISTORY_OF_DAY = "timestamp>=? AND timestamp<date(?, '+1 day') AND id NOT IN (SELECT job_id FROM term_queue)"
+COUNT_HISTORY = ("SELECT cust_name, priority, COUNT(*) FROM jobs WHERE " + HISTORY_OF_DAY +
+                 " GROUP BY cust_name, priority")
+DELETE_HISTORY = "DELETE FROM jobs WHERE " + HISTORY_OF_DAY
+UPDATE_JOB_COUNT = "UPDATE job_counts SET count=count+? WHERE day=? AND cust_name=? AND priority=?"
+
+
+class Database:
+
+    def __init__(self, path='edge.db', poolSize=16, busyTimeout=5.0, statementCache=128, batchSize=1000,
+                 batchDelay=0.001, sync='normal'):
+        """Variable initialisation for the class, starting the writer
+
+        Parameters:
+            path (str): Path of the SQLite database
+                (default is 'edge.db')
+            poolSize (int): The maximum number of open reading connections, any further readers wait for one
+                (default is 16)
+            busyTimeout (float): The number of seconds to wait for a lock on the database before failing
+                (default is 5.0)
+            statementCache (int): The number of prepared statements kept by each connection
+                (default is 128)
+            batchSize (int): The maximum number of changes committed together
+                (default is 1000)
+            batchDelay (float): The longest time in seconds a change waits for others to be committed with
+                (default is 0.001)
+            sync (str): The durability of the commits, one of SYNC_MODES
+                (default is 'normal')
+
+        """
+
+        self.path = path
+        self.poolSize = max(poolSize, 1)
+        self.busyTimeout = busyTimeout
+        self.statementCache = statementCache
+        self.batchSize = max(batchSize, 1)
+        self.batchDelay = batchDelay
+        self.sync = sync
+
+        # idle reading connections, the most recently used is handed out first
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+        # changes waiting for the writer, as (function, future) pairs, None stops the writer
+        self.pending = queue.Queue()
+        self.writer = threading.Thread(target=self.write, daemon=True)
+        self.writer.start()
+
+    def connect(self):
+        """Opens a new connection to the database
+
+        Returns:
+            Connection: The connection
+
+        """
+
+        # connections are handed between threads by the pool, but only used by one thread at a time
+        db = sqlite3.connect(self.path, timeout=self.busyTimeout, cached_statements=self.statementCache,
+                             check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous={}".format(self.sync.upper()))
+        db.execute("PRAGMA busy_timeout={}".format(int(self.busyTimeout * 1000)))
+        return db
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection from the pool, waiting for one if all are in use. Any transaction
+        left open when an error is raised is rolled back before the connection is returned
+
+        Returns:
+            Connection: The connection
+
+        """
+
+        db = None
+        with self.lock:
+            if self.idle.empty() and self.opened < self.poolSize:
+                self.opened += 1
+                db = self.connect()
+        if db is None:
+            db = self.idle.get()
+
+        try:
+            yield db
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            self.idle.put(db)
+
+    @contextmanager
+    def cursor(self):
+        """Borrows a cursor on a pooled connection
+
+        Returns:
+            Cursor: The cursor
+
+        """
+
+        with self.connection() as db:
+            yield db.cursor()
+
+    def migrate(self):
+        """Sets up the database if it does not yet exist and migrates it to the latest schema"""
+
+        with self.connection() as db:
+            migrate(db)
+
+    def submit(self, change):
+        """Hands a change to the writer
+
+        Parameters:
+            change (function): Called by the writer with a cursor to make the change, and returns its result
+
+        Returns:
+            Future: Resolved with the result of the change once it has been committed
+
+        """
+
+        future = Future()
+        self.pending.put((change, future))
+        return future
+
+    def write(self):
+        """Run by the writer thread, committing the pending changes in batches"""
+
+        db = self.connect()
+        db.isolation_level = None  # transactions are managed by the writer
+        stopping = False
+
+        while not stopping:
+            batch = []
+            change = self.pending.get()
+
+            # gather further changes until the batch is full or the first change has waited long enough
+            deadline = time.monotonic() + self.batchDelay
+            while change is not None:
+                batch.append(change)
+                if len(batch) >= self.batchSize:
+                    break
+                try:
+                    change = self.pending.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            stopping = change is None
+
+            if len(batch) > 0:
+                self.commit(db, batch)
+
+        db.close()
+
+    def commit(self, db, batch):
+        """Applies a batch of changes in a single transaction, each in a savepoint of its own so
+        a failing change is rolled back without affecting the rest
+
+        Parameters:
+            db (Connection): The writer connection
+            batch (list): The changes as (function, future) pairs
+
+        """
+
+        cur = db.cursor()
+        results = []
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for change, future in batch:
+                cur.execute("SAVEPOINT change")
+                try:
+                    results.append((future, change(cur), None))
+                except Exception as e:
+                    cur.execute("ROLLBACK TO change")
+                    results.append((future, None, e))
+                cur.execute("RELEASE change")
+            cur.execute("COMMIT")
+        except sqlite3.Error as e:
+            # nothing in the batch was committed
+            if db.in_transaction:
+                cur.execute("ROLLBACK")
+            for change, future in batch:
+                future.set_exception(e)
+            return
+
+        # callers are only told once their changes are committed
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def queue_job(self, client, ip, port, priority, ports):
+        """Adds a job to the job queue, which must have been admitted beforehand
+
+        Parameters:
+            client (str): Name of the client
+            ip (str): Address of the client
+            port (int): Port the client is listening on for notifications
+            priority (int): The job priority
+            ports (str): The ports requested for the job
+
+        Returns:
+            Future: Resolved with the job_queue record of the job
+
+        """
+
+        def change(cur):
+            cur.execute("INSERT INTO job_queue (cust_name, cust_ip, cust_port, priority, ports) VALUES (?, ?, ?, ?, ?)",
+                        (client, ip, port, priority, ports))
+            cur.execute(SELECT_QUEUED_JOB, (cur.lastrowid,))
+            return cur.fetchone()
+
+        return self.submit(change)
+
+    def queue_jobs(self, rows):
+        """Adds a batch of jobs to the job queue, which must have been admitted beforehand
+
+        Parameters:
+            rows (list): The client, address, port, priority and ports of each job
+
+        Returns:
+            Future: Resolved with the job_queue records of the jobs, in the order of the rows given
+
+        """
+
+        def change(cur):
+            # the generated job IDs are consecutive as the writer is the only one adding jobs
+            cur.executemany("INSERT INTO job_queue (cust_name, cust_ip, cust_port, priority, ports) "
+                            "VALUES (?, ?, ?, ?, ?)", rows)
+            cur.execute("SELECT last_insert_rowid()")
+            last_id = cur.fetchone()[0]
+            cur.execute(SELECT_QUEUED_JOBS, (last_id - len(rows) + 1, last_id))
+            return cur.fetchall()
+
+        return self.submit(change)
+
+    def dequeue_job(self, job_id):
+        """Deletes a job from the job queue, used when it is terminated before being started
+
+        Parameters:
+            job_id (int): The ID of the job
+
+        Returns:
+            Future: Resolved with True/False whether the job was still queued
+
+        """
+
+        def change(cur):
+            cur.execute(DELETE_QUEUED_JOB, (job_id,))
+            return cur.rowcount > 0
+
+        return self.submit(change)
+
+    def claim_jobs(self, job_ids):
+        """Moves jobs from the job queue to the jobs history table
+
+        Parameters:
+            job_ids (list): The IDs of the jobs
+
+        Returns:
+            Future: Resolved with the set of the IDs of the jobs moved, any others had been removed
+            from the queue in the meantime
+
+        """
+
+        def change(cur):
+            claimed = set()
+            for job_id in job_ids:
+                cur.execute(CLAIM_JOB, (job_id,))
+                if cur.rowcount > 0:
+                    cur.execute(DELETE_QUEUED_JOB, (job_id,))
+                    claimed.add(job_id)
+            return claimed
+
+        return self.submit(change)
+
+    def queue_terminations(self, job_ids, reason):
+        """Adds jobs to the termination queue, any already queued keep their original reason
+
+        Parameters:
+            job_ids (list): The IDs of the jobs
+            reason (str): The reason for terminating the jobs
+
+        Returns:
+            Future: Resolved once the jobs are queued
+
+        """
+
+        def change(cur):
+            cur.executemany("INSERT OR IGNORE INTO term_queue (job_id, reason) VALUES (?,?)",
+                            [(job_id, reason) for job_id in job_ids])
+
+        return self.submit(change)
+
+    def remove_terminations(self, job_ids):
+        """Deletes jobs which have been terminated from the termination queue
+
+        Parameters:
+            job_ids (list): The IDs of the jobs
+
+        Returns:
+            Future: Resolved once the jobs are deleted
+
+        """
+
+        def change(cur):
+            cur.executemany(DELETE_TERMINATION, [(job_id,) for job_id in job_ids])
+
+        return self.submit(change)
+
+    def get_history_days(self, before):
+        """Gets the days of the jobs history older than a given day
+
+        Parameters:
+            before (str): The day formatted as YYYY-MM-DD
+
+        Returns:
+            list: The days formatted as YYYY-MM-DD, oldest first
+
+        """
+
+        with self.connection() as db:
+            return [row[0] for row in db.execute(SELECT_HISTORY_DAYS, (before,)).fetchall()]
+
+    def get_history(self, day):
+        """Gets the jobs history of a day
+
+        Parameters:
+            day (str): The day formatted as YYYY-MM-DD
+
+        Returns:
+            list: The jobs records
+
+        """
+
+        with self.connection() as db:
+            return db.execute(SELECT_HISTORY, (day, day)).fetchall()
+
+    def roll_up_history(self, day):
+        """Rolls the jobs history of a day up into per client and priority counts and deletes it,
+        leaving any jobs still queued for termination as their clients are yet to be notified
+
+        Parameters:
+            day (str): The day formatted as YYYY-MM-DD
+
+        Returns:
+            Future: Resolved with the number of jobs records deleted
+
+        """
+
+        def change(cur):
+            cur.execute(COUNT_HISTORY, (day, day))
+            for client, priority, count in cur.fetchall():
+                cur.execute(UPDATE_JOB_COUNT, (count, day, client, priority))
+                if cur.rowcount == 0:
+                    cur.execute("INSERT INTO job_counts (day, cust_name, priority, count) VALUES (?,?,?,?)",
+                                (day, client, priority, count))
+            cur.execute(DELETE_HISTORY, (day, day))
+            return cur.rowcount
+
+        return self.submit(change)
+
+    def reclaim_space(self, pages):
+        """Returns free pages of the database file to the file system
+
+        Parameters:
+            pages (int): The maximum number of pages to return
+
+        Returns:
+            Future: Resolved with the number of free pages left
+
+        """
+
+        def change(cur):
+            cur.execute("PRAGMA incremental_vacuum({})".format(int(pages))).fetchall()
+            return cur.execute("PRAGMA freelist_count").fetchone()[0]
+
+        return self.submit(change)
+
+    def get_terminations(self):
+        """Gets the termination queue along with the client of each job
+
+        Returns:
+            list: The job ID, reason, client name, client address and client port of each request
+
+        """
+
+        with self.connection() as db:
+            return db.execute("SELECT t.job_id, t.reason, j.cust_name, j.cust_ip, j.cust_port FROM term_queue t "
+                              "LEFT JOIN jobs j ON j.id=t.job_id").fetchall()
+
+    def close(self):
+        """Commits any pending changes, stops the writer and closes the idle connections,
+        used when EFS is being shut down"""
+
+        self.pending.put(None)
+        self.writer.join()
+
+        while True:
+            try:
+                db = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            db.close()
+            with self.lock:
+                self.opened -= 1
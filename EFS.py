@@ -9,15 +9,23 @@ Arkadiusz Madej
 """
 
 
-import struct
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from Scheduler import Scheduler
 from Monitor import Monitor
+from ContainerRegistry import ContainerRegistry
+from Database import Database, SYNC_MODES
+from HistoryCompactor import HistoryCompactor
+from Admission import Admission
+import Metrics
+import Protocol
+from Policies import POLICIES, PRIORITY_WEIGHTED, load_policies, parse_weights
 from threading import Thread
 import socket
 import ssl
 import configparser
 import sqlite3
-import json
 import psutil
 import math
 
@@ -34,6 +42,45 @@ MAX_CPU = None
 PORT_RANGE_LOWER = None
 PORT_RANGE_UPPER = None
 STRATEGY = None
+POLICY_MODULES = None
+FRONTEND = None
+MAX_CONNECTIONS = None
+REQUEST_TIMEOUT = None
+SESSION_TIMEOUT = None
+WORKERS = None
+POOL_SIZE = None
+POOL_PORTS = None
+PROVISION_WORKERS = None
+PROVISION_TIMEOUT = None
+IDLE_THRESHOLD = None
+IDLE_PERIOD = None
+SAMPLE_INTERVAL = None
+STOP_TIMEOUT = None
+TERMINATE_WORKERS = None
+LOAD_INTERVAL = None
+LOAD_SMOOTHING = None
+METRICS_PORT = None
+PRIORITY_WEIGHTS = None
+DB_CONNECTIONS = None
+DB_TIMEOUT = None
+DB_BATCH_SIZE = None
+DB_BATCH_DELAY = None
+DB_SYNC = None
+HISTORY_RETENTION = None
+HISTORY_ARCHIVE = None
+COMPACT_INTERVAL = None
+CLIENT_QUEUE = None
+CLIENT_RATE = None
+CLIENT_BURST = None
+RETRY_AFTER = None
+
+# EFS components
+database = None
+registry = None
+scheduler = None
+monitor = None
+compactor = None
+admission = None
 
 # SSL certificates
 server_cert = 'certs/server.crt'
@@ -45,7 +92,12 @@ def read_config():
     """Reads the configuration file"""
 
     global HOST, PORT, MAX_QUEUE, BASE_CPU, BASE_MEM, CPU_UNIT, MEM_UNIT, MAX_CPU, PORT_RANGE_LOWER, PORT_RANGE_UPPER,\
-        MAX_JOBS, STRATEGY
+        MAX_JOBS, STRATEGY, POLICY_MODULES, FRONTEND, MAX_CONNECTIONS, REQUEST_TIMEOUT, WORKERS, \
+        SESSION_TIMEOUT, POOL_SIZE, POOL_PORTS, PROVISION_WORKERS, PROVISION_TIMEOUT, \
+        IDLE_THRESHOLD, IDLE_PERIOD, SAMPLE_INTERVAL, STOP_TIMEOUT, TERMINATE_WORKERS, \
+        LOAD_INTERVAL, LOAD_SMOOTHING, METRICS_PORT, PRIORITY_WEIGHTS, DB_CONNECTIONS, DB_TIMEOUT, \
+        DB_BATCH_SIZE, DB_BATCH_DELAY, DB_SYNC, HISTORY_RETENTION, HISTORY_ARCHIVE, COMPACT_INTERVAL, \
+        CLIENT_QUEUE, CLIENT_RATE, CLIENT_BURST, RETRY_AFTER
 
     # create config parses instance
     parser = configparser.ConfigParser()
@@ -63,7 +115,41 @@ def read_config():
     BASE_MEM = config.getint('BASEMEM')
     CPU_UNIT = config.getint('CPUUNIT')
     MEM_UNIT = config.getint('MEMUNIT')
-    STRATEGY = config.getint('STRATEGY')
+    STRATEGY = config['STRATEGY']
+    POLICY_MODULES = config.get('POLICIES', fallback='')
+    FRONTEND = config.get('FRONTEND', fallback='threaded').strip().lower()
+    MAX_CONNECTIONS = config.getint('MAXCONNECTIONS', fallback=1000)
+    REQUEST_TIMEOUT = config.getfloat('REQUESTTIMEOUT', fallback=10)
+    WORKERS = config.getint('WORKERS', fallback=8)
+    SESSION_TIMEOUT = config.getfloat('SESSIONTIMEOUT', fallback=300)
+    POOL_SIZE = config.getint('POOLSIZE', fallback=0)
+    POOL_PORTS = config.get('POOLPORTS', fallback='')
+    PROVISION_WORKERS = config.getint('PROVISIONWORKERS', fallback=8)
+    PROVISION_TIMEOUT = config.getfloat('PROVISIONTIMEOUT', fallback=10)
+    IDLE_THRESHOLD = config.getfloat('IDLETHRESHOLD', fallback=10)
+    IDLE_PERIOD = config.getfloat('IDLEPERIOD', fallback=2)
+    SAMPLE_INTERVAL = config.getfloat('SAMPLEINTERVAL', fallback=10)
+    STOP_TIMEOUT = config.getint('STOPTIMEOUT', fallback=10)
+    TERMINATE_WORKERS = config.getint('TERMINATEWORKERS', fallback=8)
+    LOAD_INTERVAL = config.getfloat('LOADINTERVAL', fallback=1)
+    LOAD_SMOOTHING = config.getfloat('LOADSMOOTHING', fallback=0.3)
+    METRICS_PORT = config.getint('METRICSPORT', fallback=0)
+    try:
+        PRIORITY_WEIGHTS = parse_weights(config.get('PRIORITYWEIGHTS', fallback=''))
+    except ValueError:
+        PRIORITY_WEIGHTS = {}  # rejected below
+    DB_CONNECTIONS = config.getint('DBCONNECTIONS', fallback=16)
+    DB_TIMEOUT = config.getfloat('DBTIMEOUT', fallback=5)
+    DB_BATCH_SIZE = config.getint('DBBATCHSIZE', fallback=1000)
+    DB_BATCH_DELAY = config.getfloat('DBBATCHDELAY', fallback=1) / 1000
+    DB_SYNC = config.get('DBSYNC', fallback='normal').strip().lower()
+    HISTORY_RETENTION = config.getint('HISTORYRETENTION', fallback=0)
+    HISTORY_ARCHIVE = config.get('HISTORYARCHIVE', fallback='').strip()
+    COMPACT_INTERVAL = config.getfloat('COMPACTINTERVAL', fallback=3600)
+    CLIENT_QUEUE = config.getint('CLIENTQUEUE', fallback=0)
+    CLIENT_RATE = config.getfloat('CLIENTRATE', fallback=0)
+    CLIENT_BURST = config.getint('CLIENTBURST', fallback=1)
+    RETRY_AFTER = config.getfloat('RETRYAFTER', fallback=5)
 
     # calculate max jobs allowed to run using the provided config and resources
     max_cpu = math.floor(((MAX_CPU * psutil.cpu_count()) - BASE_CPU) / CPU_UNIT)
@@ -71,155 +157,152 @@ def read_config():
 
     MAX_JOBS = min(max_cpu, max_mem)
 
-    if STRATEGY not in range(0, 4):
+    # import any additional policies and check the strategy refers to a registered one,
+    # and that any priority weights cover every priority a job can have
+    load_policies(POLICY_MODULES)
+    bad_weights = PRIORITY_WEIGHTS is not None and not set(PRIORITY_WEIGHTED).issubset(PRIORITY_WEIGHTS)
+    if STRATEGY.strip().lower() not in POLICIES or FRONTEND not in ('threaded', 'asyncio') or bad_weights or \
+            DB_SYNC not in SYNC_MODES:
         print("Bad configuration")
         exit(1)
 
 
-def recv_message(sock):
-    """Receives a message sent by the client
+def add_new_job(addr, client, request):
+    """If space is available in the queue, it adds a job otherwise rejects it
 
     Parameters:
-        sock (socket): HTTP socket connection
-
-    Returns:
-        str: The message
-
-    """
-
-    # First acquire the message length
-    msg_len = recv_data(sock, 4)
-
-    if not msg_len:
-        return None
-    msg_len = struct.unpack('>I', msg_len)[0]
-
-    # Return the full message, undecoded
-    return recv_data(sock, msg_len)
-
-
-def recv_data(sock, msg_len):
-    """Receives data from HTTP connection
-
-    Parameters:
-        sock (socket): HTTP socket connection
-        msg_len (int): Length of the message to receive
+        addr (list): Client address structure
+        client (str): Name of the client
+        request (dict):  JSON dictionary containing the job request
 
     Returns:
-        str: The message
+        dict: The reply message for the client
 
     """
 
-    data = b''
-    # Read the message data
-    while len(data) < msg_len:
-        packet = sock.recv(msg_len - len(data))
-        if not packet:
-            return None
-        data += packet
+    row = (client, addr[0], request['Job']['CommsPort'], request['Job']['Priority'], request['Job']['Ports'])
 
-    # Return undecoded message data
-    return data
+    # refuse the job straight away if the queue or the client is over its limits
+    admitted, refusal = admission.admit(client)
+    if refusal is not None:
+        return refuse_jobs(refusal)
 
+    try:
+        job = database.queue_job(*row).result()
 
-def send_msg(msg, conn):
-    """Sends a structured message containing the message length at the start
+        # hand the queued job to the scheduler
+        scheduler.job_queued(job)
+    finally:
+        admission.release(client)
 
-    Parameters:
-        msg (str): The message to be sent
-        conn (socket): HTTP socket connection
-
-    """
+    # notify client of job being accepted
+    return {'Msg': 'Accepted', 'RequestType': 'Start', 'JobID': job[0]}
 
-    msg = struct.pack('>I', len(msg)) + msg.encode('ascii')
-    conn.sendall(msg)
 
-
-def add_new_job(conn, addr, client, request):
-    """If space is available in the queue, it adds a job otherwise informs client of rejection
+def add_new_jobs(addr, client, request):
+    """Adds a batch of jobs to the queue in a single transaction, as many as there is space for
 
     Parameters:
-        conn (socket): HTTP socket connection
         addr (list): Client address structure
         client (str): Name of the client
-        request (dict):  JSON dictionary containing the job request
+        request (dict):  JSON dictionary containing the job requests
 
-    """
-
-    # get size of job queue
-    db = sqlite3.connect('edge.db')
-    cur = db.cursor()
-    cur.execute("SELECT COUNT(*) FROM job_queue")
-    q_len = cur.fetchone()
-
-    # if space available queue job else reject
-    if q_len[0] <= MAX_QUEUE:
-        cur.execute("INSERT INTO job_queue (cust_name, cust_ip, cust_port, priority, ports) VALUES (?, ?, ?, ?, ?)",
-                    (client, addr[0], request['Job']['CommsPort'], request['Job']['Priority'], request['Job']['Ports']))
-        db.commit()
-        cur.execute("SELECT last_insert_rowid()")
-
-        # get generated job ID
-        job_id = cur.fetchone()[0]
-
-        # notify client of job being accepted
-        msg = {'Msg': 'Accepted', 'RequestType': 'Start', 'JobID': job_id}
-        send_msg(json.dumps(msg), conn)
-    else:
-        # notify client of job being refused
-        msg = {'Msg': 'Refused', 'Reason': 'No space in job queue'}
-        send_msg(json.dumps(msg), conn)
+    Returns:
+        dict: The reply message for the client, listing the outcome of each job in the order requested
 
-    db.close()
-    conn.close()
+    """
 
+    results = [None] * len(request['Jobs'])
+    rows = []
 
-def terminate_job(conn, request):
+    # check each of the requested jobs is complete
+    for i, job in enumerate(request['Jobs']):
+        try:
+            rows.append((i, (client, addr[0], job['CommsPort'], job['Priority'], job['Ports'])))
+        except (KeyError, TypeError):
+            Metrics.REQUESTS_REFUSED.inc('invalid')
+            results[i] = {'Msg': 'Refused', 'Reason': 'The job request was invalid'}
+
+    # queue as many jobs as the queue and client limits allow and reject the rest
+    admitted, refusal = admission.admit(client, len(rows))
+    for i, row in rows[admitted:]:
+        results[i] = refuse_jobs(refusal)
+    rows = rows[:admitted]
+
+    jobs = []
+    try:
+        if len(rows) > 0:
+            jobs = database.queue_jobs([row for i, row in rows]).result()
+
+        # hand the queued jobs to the scheduler
+        for (i, row), job in zip(rows, jobs):
+            scheduler.job_queued(job)
+            results[i] = {'Msg': 'Accepted', 'JobID': job[0]}
+    finally:
+        admission.release(client, admitted)
+
+    if len(jobs) == 0:
+        return {'Msg': 'Refused', 'Reason': 'None of the jobs could be queued', 'Jobs': results}
+    return {'Msg': 'Accepted', 'RequestType': 'Start Batch', 'Jobs': results}
+
+
+def terminate_job(request):
     """Adds the job into the termination queue or removes from job queue if not yet started
 
     Parameters:
-        conn (socket): HTTP socket connection
         request (dict): JSON dictionary containing the termination request
 
-    """
-
-    db = sqlite3.connect('edge.db')
-    cur = db.cursor()
+    Returns:
+        dict: The reply message for the client
 
-    job_id = request['JobID']
+    """
 
-    # check if job is still in queue
-    cur.execute("SELECT COUNT(*) FROM job_queue WHERE id=?", (job_id,))
-    count = cur.fetchone()[0]
+    # a job ID which is not a number can never match a job, and would be refused by the database
+    try:
+        job_id = int(request['JobID'])
+    except ValueError:
+        return handle_invalid_message()
 
     # if job in queue then delete else queue for termination
-    if count > 0:
-        cur.execute("DELETE FROM job_queue WHERE id=?", (job_id,))
+    if database.dequeue_job(job_id).result():
+        scheduler.job_removed(job_id)
         # notify client of job being removed from queue
         msg = {'Msg': 'Terminated', 'JobId': job_id, 'Reason': 'Termination Requested'}
-        send_msg(json.dumps(msg), conn)
     else:
-        cur.execute("INSERT INTO term_queue(job_id, reason) VALUES (?,?)", (job_id, 'Termination Requested'))
+        database.queue_terminations([job_id], 'Termination Requested').result()
+        monitor.notify()
         # notify client of job being queued for termination
         msg = {'Msg': 'Accepted', 'RequestType': 'Terminate', 'JobID': job_id}
-        send_msg(json.dumps(msg), conn)
 
-    conn.close()
-    db.commit()
-    db.close()
+    return msg
 
 
-def handle_invalid_message(conn):
-    """Used to inform the client of an invalid request
+def refuse_jobs(refusal):
+    """Used to inform the client of jobs refused by admission control
 
     Parameters:
-        conn (socket): HTTP socket connection
+        refusal (tuple): The reason, the number of seconds to wait before trying again and the kind of refusal
+
+    Returns:
+        dict: The reply message for the client
 
     """
 
-    msg = {'Msg': 'Refused', 'Reason': 'The request message was invalid'}
-    send_msg(json.dumps(msg), conn)
-    conn.close()
+    reason, retry_after, kind = refusal
+    Metrics.REQUESTS_REFUSED.inc(kind)
+    return {'Msg': 'Refused', 'Reason': reason, 'RetryAfter': round(retry_after, 3)}
+
+
+def handle_invalid_message():
+    """Used to inform the client of an invalid request
+
+    Returns:
+        dict: The reply message for the client
+
+    """
+
+    Metrics.REQUESTS_REFUSED.inc('invalid')
+    return {'Msg': 'Refused', 'Reason': 'The request message was invalid'}
 
 
 def get_peer_name(cert):
@@ -239,6 +322,73 @@ def get_peer_name(cert):
             return x[0][1]
 
 
+def process_request(addr, client, request):
+    """Carries out a request and gets the reply for the client
+
+    Parameters:
+        addr (list): Client address structure
+        client (str): Name of the client
+        request (dict): JSON dictionary containing the request
+
+    Returns:
+        dict: The reply message for the client
+
+    """
+
+    try:
+        if request.get('Request') == 'New Job':
+            return add_new_job(addr, client, request)
+        elif request.get('Request') == 'New Jobs':
+            return add_new_jobs(addr, client, request)
+        elif request.get('Request') == 'Terminate':
+            return terminate_job(request)
+    except (KeyError, TypeError):
+        pass  # the request is missing some of its fields
+    except sqlite3.Error as e:
+        # the database stayed locked for longer than the busy timeout
+        print("Unable to carry out request: {}".format(e))
+        Metrics.REQUESTS_REFUSED.inc('database')
+        return {'Msg': 'Refused', 'Reason': 'The request could not be stored, try again later'}
+
+    return handle_invalid_message()
+
+
+def reply(msg, request, version):
+    """Tells a client which asked for a protocol version the version chosen
+
+    Parameters:
+        msg (dict): The reply message for the client
+        request (dict): The request being replied to
+        version (int): The protocol version chosen
+
+    Returns:
+        dict: The reply message for the client
+
+    """
+
+    if 'Protocol' in request:
+        msg['Protocol'] = version
+    return msg
+
+
+def process_session_request(addr, client, request):
+    """Carries out a request received within a session, tagging the reply with the request ID
+
+    Parameters:
+        addr (list): Client address structure
+        client (str): Name of the client
+        request (dict): JSON dictionary containing the request
+
+    Returns:
+        dict: The reply message for the client
+
+    """
+
+    msg = process_request(addr, client, request)
+    msg['RequestID'] = request.get('RequestID')
+    return msg
+
+
 def handle_request(connection, addr, client):
     """Used to handle a newly received request
 
@@ -249,21 +399,157 @@ def handle_request(connection, addr, client):
 
     """
 
-    # read in received request as JSON
-    request = json.loads(str(recv_message(connection), 'utf-8'))
+    # read in received request and agree on the protocol version to reply with
+    request = Protocol.decode(Protocol.recv_message(connection))
+    version = Protocol.negotiate(request, client)
 
-    if request['Request'] == 'New Job':
-        try:
-            add_new_job(connection, addr, client, request)
-        except sqlite3.DatabaseError:
-            add_new_job(connection, addr, client, request)
-    elif request['Request'] == 'Terminate':
-        try:
-            terminate_job(connection, request)
-        except sqlite3.DatabaseError:
-            terminate_job(connection, request)
+    if request.get('Request') == 'Open Session':
+        handle_session(connection, addr, client, request, version)
     else:
-        handle_invalid_message(connection)
+        msg = reply(process_request(addr, client, request), request, version)
+        Protocol.send_msg(msg, connection, version)
+    connection.close()
+
+
+def handle_session(connection, addr, client, request, version):
+    """Used to handle a session, in which the client sends any number of requests over the same connection
+
+    Parameters:
+        connection (socket): HTTP socket connection
+        addr (list): Client address structure
+        client (str): Name of the client
+        request (dict): The request which opened the session
+        version (int): The protocol version used for the session
+
+    """
+
+    accepted = reply({'Msg': 'Accepted', 'RequestType': 'Session'}, request, version)
+    Protocol.send_msg(accepted, connection, version)
+    connection.settimeout(SESSION_TIMEOUT)
+
+    try:
+        # requests are answered in the order they were sent until the client closes the session
+        while True:
+            data = Protocol.recv_message(connection)
+            if data is None:
+                break
+
+            request = Protocol.decode(data)
+            if request.get('Request') == 'Close Session':
+                break
+            Protocol.send_msg(process_session_request(addr, client, request), connection, version)
+    except (socket.timeout, ConnectionError, ssl.SSLError) as e:
+        print('Session with {} ended: {}'.format(addr[0], e))
+
+
+async def send_msg_async(msg, writer, lock, version):
+    """Sends a structured message to a client of the asyncio request handler
+
+    Parameters:
+        msg (dict): The message to be sent
+        writer (StreamWriter): Stream of the client connection
+        lock (Lock): Prevents replies to pipelined requests from being sent at the same time
+        version (int): The protocol version
+
+    """
+
+    async with lock:
+        writer.write(Protocol.frame(msg, version))
+        await writer.drain()
+
+
+async def run_async_request(func, addr, client, request, limiter, executor):
+    """Carries out a request in the executor once the number of requests being handled allows
+
+    Parameters:
+        func (function): Function which carries out the request
+        addr (list): Client address structure
+        client (str): Name of the client
+        request (dict): JSON dictionary containing the request
+        limiter (Semaphore): Limits the number of requests handled at once
+        executor (Executor): Runs the database work of the requests
+
+    Returns:
+        dict: The reply message for the client
+
+    """
+
+    async with limiter:
+        return await asyncio.get_event_loop().run_in_executor(executor, func, addr, client, request)
+
+
+async def handle_async_request(reader, writer, limiter, executor):
+    """Used to handle a newly received request in the asyncio request handler
+
+    Parameters:
+        reader (StreamReader): Stream of the client connection
+        writer (StreamWriter): Stream of the client connection
+        limiter (Semaphore): Limits the number of requests handled at once
+        executor (Executor): Runs the database work of the requests
+
+    """
+
+    addr = writer.get_extra_info('peername')
+    client = get_peer_name(writer.get_extra_info('peercert'))
+    lock = asyncio.Lock()
+
+    try:
+        # a client which is slow to send its request only holds up itself
+        request = await asyncio.wait_for(Protocol.recv_message_async(reader), REQUEST_TIMEOUT)
+        if request is None:
+            return
+
+        request = Protocol.decode(request)
+        version = Protocol.negotiate(request, client)
+        if request.get('Request') == 'Open Session':
+            accepted = reply({'Msg': 'Accepted', 'RequestType': 'Session'}, request, version)
+            await send_msg_async(accepted, writer, lock, version)
+            await handle_async_session(reader, writer, lock, addr, client, limiter, executor, version)
+        else:
+            msg = await run_async_request(process_request, addr, client, request, limiter, executor)
+            await send_msg_async(reply(msg, request, version), writer, lock, version)
+    except (asyncio.TimeoutError, ConnectionError, ssl.SSLError) as e:
+        print('Request from {} failed: {}'.format(addr[0], e))
+    finally:
+        writer.close()
+
+
+async def handle_async_session(reader, writer, lock, addr, client, limiter, executor, version):
+    """Used to handle a session in the asyncio request handler, the requests sent within it are
+    carried out concurrently and each reply is sent as soon as it is ready
+
+    Parameters:
+        reader (StreamReader): Stream of the client connection
+        writer (StreamWriter): Stream of the client connection
+        lock (Lock): Prevents replies to pipelined requests from being sent at the same time
+        addr (list): Client address structure
+        client (str): Name of the client
+        limiter (Semaphore): Limits the number of requests handled at once
+        executor (Executor): Runs the database work of the requests
+        version (int): The protocol version used for the session
+
+    """
+
+    async def answer(request):
+        msg = await run_async_request(process_session_request, addr, client, request, limiter, executor)
+        await send_msg_async(msg, writer, lock, version)
+
+    pending = set()
+    try:
+        while True:
+            data = await asyncio.wait_for(Protocol.recv_message_async(reader), SESSION_TIMEOUT)
+            if data is None:
+                break
+
+            request = Protocol.decode(data)
+            if request.get('Request') == 'Close Session':
+                break
+            pending.add(asyncio.ensure_future(answer(request)))
+            pending = set(task for task in pending if not task.done())
+    finally:
+        # send the replies to any requests still being worked on before the connection is closed
+        if pending:
+            await asyncio.wait(pending)
 
 
 def print_header():
@@ -280,16 +566,28 @@ def print_header():
     print('')
 
 
-def start_connection_service():
-    """Starts the Request Handler"""
+def create_ssl_context():
+    """Creates the SSL context used to authenticate clients
 
-    print_header()
+    Returns:
+        SSLContext: The SSL context
+
+    """
 
-    # set up SSL
     SSL = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
     SSL.verify_mode = ssl.CERT_REQUIRED  # to only allow authorised connections
     SSL.load_cert_chain(certfile=server_cert, keyfile=server_key)
     SSL.load_verify_locations(cafile=client_certs)
+    return SSL
+
+
+def start_connection_service():
+    """Starts the Request Handler"""
+
+    print_header()
+
+    # set up SSL
+    SSL = create_ssl_context()
 
     #  set up socket to listen for incoming connections
     connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -317,48 +615,151 @@ def start_connection_service():
             break
 
 
+def start_async_connection_service():
+    """Starts the asyncio Request Handler, which carries out TLS handshakes concurrently
+    and limits the number of requests handled at once"""
+
+    print_header()
+
+    # set up SSL
+    SSL = create_ssl_context()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    limiter = asyncio.Semaphore(MAX_CONNECTIONS)
+    executor = ThreadPoolExecutor(max_workers=WORKERS)
+
+    # handshakes are carried out by the event loop so a slow client never blocks the others
+    handler = functools.partial(handle_async_request, limiter=limiter, executor=executor)
+    server = loop.run_until_complete(asyncio.start_server(handler, HOST, PORT, ssl=SSL, reuse_address=True,
+                                                          backlog=MAX_CONNECTIONS))
+
+    print('Listening for incoming connections on {}:{}'.format(HOST, PORT))
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:  # handles terminating EFS
+        print('Shutting down fair edge job scheduler')
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        executor.shutdown()
+
+
+def start_registry_service():
+    """Starts the Container Registry component, which is shared by the Scheduler and Monitor"""
+
+    global registry
+
+    registry = ContainerRegistry()
+    registry.start()
+
+
 def start_scheduler_service():
     """Starts the Scheduler component"""
 
-    sched = Scheduler(maxJobs=MAX_JOBS, unitCPU=CPU_UNIT, unitMem=MEM_UNIT, maxCPU=MAX_CPU, portLower=PORT_RANGE_LOWER,
-                      portUpper=PORT_RANGE_UPPER, strategy=STRATEGY)
-    sched.start()
+    global scheduler
+
+    scheduler = Scheduler(maxJobs=MAX_JOBS, unitCPU=CPU_UNIT, unitMem=MEM_UNIT, maxCPU=MAX_CPU,
+                          portLower=PORT_RANGE_LOWER, portUpper=PORT_RANGE_UPPER, strategy=STRATEGY, poolSize=POOL_SIZE,
+                          poolPorts=POOL_PORTS, provisionWorkers=PROVISION_WORKERS,
+                          provisionTimeout=PROVISION_TIMEOUT, baseCPU=BASE_CPU, baseMem=BASE_MEM,
+                          loadInterval=LOAD_INTERVAL, loadSmoothing=LOAD_SMOOTHING, registry=registry,
+                          database=database, priorityWeights=PRIORITY_WEIGHTS)
+    scheduler.start()
 
 
 def start_monitoring_service():
     """Starts the Monitor component"""
 
-    monitor = Monitor()
+    global monitor
+
+    monitor = Monitor(scheduler=scheduler, idleThreshold=IDLE_THRESHOLD, idlePeriod=IDLE_PERIOD * 60,
+                      sampleInterval=SAMPLE_INTERVAL, stopTimeout=STOP_TIMEOUT, terminateWorkers=TERMINATE_WORKERS,
+                      registry=registry, database=database)
     monitor.start()
 
 
+def start_admission_service():
+    """Starts the admission control, which reads the depth of the job queue from the Scheduler"""
+
+    global admission
+
+    admission = Admission(scheduler.queue, MAX_QUEUE, clientQueue=CLIENT_QUEUE, clientRate=CLIENT_RATE,
+                          clientBurst=CLIENT_BURST, retryAfter=RETRY_AFTER)
+
+
+def start_compaction_service():
+    """Starts the History Compactor component, if a retention period is set"""
+
+    global compactor
+
+    if HISTORY_RETENTION <= 0:
+        return
+
+    compactor = HistoryCompactor(database, retention=HISTORY_RETENTION, interval=COMPACT_INTERVAL,
+                                 archive=HISTORY_ARCHIVE)
+    compactor.start()
+
+
+def start_metrics_service():
+    """Starts serving the metrics on the local metrics port, if one is set"""
+
+    if METRICS_PORT <= 0:
+        return
+
+    # metrics read from the components when scraped
+    Metrics.QUEUE_DEPTH.collect = scheduler.queue.depths
+    Metrics.RUNNING_JOBS.collect = scheduler.get_running_jobs
+    Metrics.MAX_JOBS.collect = lambda: MAX_JOBS
+    Metrics.CLIENT_SHARE.collect = scheduler.get_client_shares
+    Metrics.PRIORITY_SHARE.collect = scheduler.get_priority_shares
+    Metrics.PRIORITY_TARGET.collect = lambda: scheduler.policy.priority_weighted
+
+    # the metrics are not worth stopping EFS for, so a port already in use only disables them
+    try:
+        Metrics.start_metrics_server('127.0.0.1', METRICS_PORT)
+    except OSError as e:
+        print('Unable to serve metrics on 127.0.0.1:{}: {}'.format(METRICS_PORT, e))
+        return
+    print('Serving metrics on 127.0.0.1:{}'.format(METRICS_PORT))
+
+
 def setup_db():
-    """Sets up the database if it yet does not exist"""
+    """Opens the database, which is shared by all EFS components, and sets up the database
+    if it yet does not exist and migrates it to the latest schema"""
 
-    db = sqlite3.connect('edge.db')
-    cur = db.cursor()
+    global database
 
-    # checks if tables exists in database, if not they are created
-    cur.execute("CREATE TABLE if not exists jobs(id INTEGER PRIMARY KEY,cust_name TEXT NOT NULL,cust_ip TEXT NOT NULL,"
-                "cust_port INTEGER,priority INTEGER,timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,ports TEXT NOT NULL);")
-    cur.execute("CREATE TABLE if not exists job_queue(id INTEGER PRIMARY KEY AUTOINCREMENT,cust_name TEXT NOT NULL,"
-                "cust_ip TEXT NOT NULL,cust_port INTEGER,priority INTEGER DEFAULT 1,"
-                "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,ports TEXT NOT NULL);")
-    cur.execute("CREATE TABLE if not exists term_queue(job_id INTEGER PRIMARY KEY, reason TEXT,"
-                " FOREIGN KEY(job_id) REFERENCES jobs(id));")
+    database = Database('edge.db', poolSize=DB_CONNECTIONS, busyTimeout=DB_TIMEOUT, batchSize=DB_BATCH_SIZE,
+                        batchDelay=DB_BATCH_DELAY, sync=DB_SYNC)
+    database.migrate()
 
-    # if tables were only just created it updates the sequence to start at 1000
-    # required due to Docker not accepting value below for container ID
-    cur.execute("SELECT seq FROM SQLITE_SEQUENCE WHERE name='job_queue'")
-    if cur.fetchone() is None:
-        cur.execute("INSERT INTO SQLITE_SEQUENCE(name,seq) VALUES('job_queue', 1000)")
-    db.commit()
-    db.close()
+
+def stop_services():
+    """Stops the components once the request handler has been shut down, then commits any changes
+    still pending and closes the database"""
+
+    try:
+        # the monitor reports stopped containers to the scheduler, so it is stopped first
+        for component in (compactor, monitor, scheduler, registry):
+            if component is not None:
+                component.join()
+    finally:
+        database.close()
 
 
 if __name__ == '__main__':
-    setup_db()
     read_config()
+    setup_db()
+    start_registry_service()
     start_scheduler_service()
     start_monitoring_service()
-    start_connection_service()
+    start_compaction_service()
+    start_admission_service()
+    start_metrics_service()
+    if FRONTEND == 'asyncio':
+        start_async_connection_service()
+    else:
+        start_connection_service()
+    stop_services()
@@ -0,0 +1,238 @@
+""" The Fair Share Index for Edge Fair Scheduler
+
+This class keeps an in-memory count of the jobs run within the
+fairness window, so the scheduler does not need to scan the jobs
+history table for every scheduling decision. Counts are bucketed
+per day which matches the date('now','-7 day') window used by
+the history queries.
+"""
+
+import datetime
+from collections import Counter
+
+# counts of the jobs run per day, client and priority since a given day, from the jobs history and its roll-ups
+WINDOW_COUNTS = ("SELECT day, cust_name, priority, SUM(count) FROM ("
+                 "SELECT date(timestamp) AS day, cust_name, priority, COUNT(*) AS count FROM jobs "
+                 "WHERE timestamp>=? GROUP BY date(timestamp), cust_name, priority "
+                 "UNION ALL SELECT day, cust_name, priority, count FROM job_counts WHERE day>=?) "
+                 "GROUP BY day, cust_name, priority")
+
+
+class FairShare:
+
+    def __init__(self, window=7, clock=datetime.datetime.utcnow):
+        """Variable initialisation for the class
+
+        Parameters:
+            window (int): Length of the fairness window in days
+                (default is 7)
+            clock (function): Returns the current UTC time
+                (default is datetime.datetime.utcnow)
+
+        """
+
+        self.window = window
+        self.clock = clock
+
+        # per day buckets of counts keyed by client, priority and (client, priority)
+        self.buckets = {}
+
+        # running totals over all buckets within the window
+        self.clients = Counter()
+        self.priorities = Counter()
+        self.client_priorities = Counter()
+        self.total = 0
+
+        # incremented whenever counts are dropped in bulk, so dependent orderings know to rebuild
+        self.generation = 0
+
+    def cutoff(self):
+        """Gets the first day which is still within the fairness window
+
+        Returns:
+            str: The day formatted as YYYY-MM-DD
+
+        """
+
+        return (self.clock().date() - datetime.timedelta(days=self.window)).isoformat()
+
+    def rebuild(self, cur):
+        """Rebuilds the index from the jobs history table, along with any history which has been
+        rolled up into daily counts
+
+        Parameters:
+            cur (Cursor): Database cursor
+
+        """
+
+        self.buckets = {}
+        self.clients = Counter()
+        self.priorities = Counter()
+        self.client_priorities = Counter()
+        self.total = 0
+        self.generation += 1
+
+        cutoff = self.cutoff()
+        cur.execute(WINDOW_COUNTS, (cutoff, cutoff))
+        for day, client, priority, count in cur.fetchall():
+            self.add(day, client, priority, count)
+
+    def add(self, day, client, priority, count):
+        """Adds a count of jobs to the bucket of the specified day
+
+        Parameters:
+            day (str): The day formatted as YYYY-MM-DD
+            client (str): Name of the client
+            priority (int): The job priority
+            count (int): Number of jobs to add, negative to remove
+
+        """
+
+        bucket = self.buckets.get(day)
+        if bucket is None:
+            bucket = self.buckets[day] = Counter()
+        bucket[(client, priority)] += count
+
+        self.clients[client] += count
+        self.priorities[priority] += count
+        self.client_priorities[(client, priority)] += count
+        self.total += count
+
+    def record(self, client, priority, timestamp):
+        """Records a job which was moved into the jobs history table
+
+        Parameters:
+            client (str): Name of the client
+            priority (int): The job priority
+            timestamp (str): The job timestamp formatted as YYYY-MM-DD HH:MM:SS
+
+        """
+
+        day = timestamp[:10]
+        if day >= self.cutoff():
+            self.add(day, client, priority, 1)
+
+    def discard(self, client, priority, timestamp):
+        """Removes a previously recorded job, used when a claim is rolled back
+
+        Parameters:
+            client (str): Name of the client
+            priority (int): The job priority
+            timestamp (str): The job timestamp formatted as YYYY-MM-DD HH:MM:SS
+
+        """
+
+        day = timestamp[:10]
+        if day in self.buckets:
+            self.add(day, client, priority, -1)
+
+    def expire(self):
+        """Drops any buckets which have fallen out of the fairness window
+
+        Returns:
+            bool: True/False whether any counts have changed
+
+        """
+
+        cutoff = self.cutoff()
+        expired = [day for day in self.buckets if day < cutoff]
+        for day in expired:
+            for (client, priority), count in self.buckets.pop(day).items():
+                self.clients[client] -= count
+                self.priorities[priority] -= count
+                self.client_priorities[(client, priority)] -= count
+                self.total -= count
+
+        if len(expired) > 0:
+            self.generation += 1
+        return len(expired) > 0
+
+    def client_count(self, client):
+        """Gets the number of jobs run by a client within the window
+
+        Parameters:
+            client (str): Name of the client
+
+        Returns:
+            int: Number of jobs
+
+        """
+
+        self.expire()
+        return self.clients[client]
+
+    def priority_count(self, priority):
+        """Gets the number of jobs run with a priority within the window
+
+        Parameters:
+            priority (int): The job priority
+
+        Returns:
+            int: Number of jobs
+
+        """
+
+        self.expire()
+        return self.priorities[priority]
+
+    def client_priority_count(self, client, priority):
+        """Gets the number of jobs run by a client with a priority within the window
+
+        Parameters:
+            client (str): Name of the client
+            priority (int): The job priority
+
+        Returns:
+            int: Number of jobs
+
+        """
+
+        self.expire()
+        return self.client_priorities[(client, priority)]
+
+    def total_count(self):
+        """Gets the total number of jobs run within the window
+
+        Returns:
+            int: Number of jobs
+
+        """
+
+        self.expire()
+        return self.total
+
+    def shares(self, counts):
+        """Gets the share of the jobs run within the window for each key of a set of counts
+
+        Parameters:
+            counts (Counter): The clients or priorities counts
+
+        Returns:
+            dict: The share of the jobs, between 0 and 1, keyed by client or priority
+
+        """
+
+        self.expire()
+        if self.total <= 0:
+            return {}
+        return {k: n / self.total for k, n in counts.items() if n > 0}
+
+    def client_shares(self):
+        """Gets the share of the jobs run within the window by each client
+
+        Returns:
+            dict: The share of the jobs keyed by client name
+
+        """
+
+        return self.shares(self.clients)
+
+    def priority_shares(self):
+        """Gets the share of the jobs run within the window with each priority
+
+        Returns:
+            dict: The share of the jobs keyed by priority
+
+        """
+
+        return self.shares(self.priorities)
@@ -0,0 +1,120 @@
+""" The History Compactor for Edge Fair Scheduler
+
+This class keeps the jobs history table from growing without bound.
+At a fixed interval in the background it rolls the jobs older than
+the retention period up into daily counts per client and priority,
+which the fair share index still reads, and deletes them. The jobs
+can be copied to an archive database before they are deleted. The
+pages freed are then returned to the file system a few at a time, so
+edge.db stays bounded without ever being locked for a full vacuum.
+"""
+
+import datetime
+import sqlite3
+import threading
+from Migrations import create_tables
+
+
+class HistoryCompactor(threading.Thread):
+
+    def __init__(self, database, retention=30, interval=3600.0, archive='', vacuumPages=1000,
+                 clock=datetime.datetime.utcnow):
+        """Variable initialisation for the class
+
+        Parameters:
+            database (Database): The EFS database
+            retention (int): The number of days of jobs history to keep
+                (default is 30)
+            interval (float): The number of seconds between compactions
+                (default is 3600.0)
+            archive (str): Path of a database to copy the jobs history to before it is deleted
+                (default is '' which deletes it without a copy)
+            vacuumPages (int): The largest number of pages returned to the file system in one transaction
+                (default is 1000)
+            clock (function): Returns the current UTC time
+                (default is datetime.datetime.utcnow)
+
+        """
+
+        super(HistoryCompactor, self).__init__(daemon=True)
+        self.stopRequest = threading.Event()
+        self.database = database
+        self.retention = retention
+        self.interval = interval
+        self.archive = archive
+        self.vacuumPages = max(vacuumPages, 1)
+        self.clock = clock
+
+    def cutoff(self):
+        """Gets the first day of jobs history which is kept
+
+        Returns:
+            str: The day formatted as YYYY-MM-DD
+
+        """
+
+        return (self.clock().date() - datetime.timedelta(days=self.retention)).isoformat()
+
+    def archive_day(self, day):
+        """Copies the jobs history of a day to the archive database
+
+        Parameters:
+            day (str): The day formatted as YYYY-MM-DD
+
+        """
+
+        jobs = self.database.get_history(day)
+        db = sqlite3.connect(self.archive)
+        try:
+            create_tables(db.cursor())  # the archive has the same tables as edge.db
+            # a day may be copied again if it could not be deleted the last time
+            db.executemany("INSERT OR IGNORE INTO jobs VALUES (?,?,?,?,?,?,?)", jobs)
+            db.commit()
+        finally:
+            db.close()
+
+    def compact(self):
+        """Rolls up and deletes the jobs history older than the retention period, a day at a time,
+        and returns the pages freed to the file system
+
+        Returns:
+            int: The number of jobs records deleted
+
+        """
+
+        deleted = 0
+        for day in self.database.get_history_days(self.cutoff()):
+            if self.stopRequest.is_set():
+                break
+            if self.archive:
+                self.archive_day(day)
+            deleted += self.database.roll_up_history(day).result()
+
+        # reclaim the freed pages in small steps so other changes are not held up,
+        # until none are left or no more can be reclaimed
+        free = None
+        while not self.stopRequest.is_set():
+            left = self.database.reclaim_space(self.vacuumPages).result()
+            if left == 0 or left == free:
+                break
+            free = left
+
+        return deleted
+
+    def run(self):
+        """Compacts the jobs history at a fixed interval, starting straight away"""
+
+        while not self.stopRequest.is_set():
+            try:
+                deleted = self.compact()
+                if deleted > 0:
+                    print("Compacted {} jobs history records".format(deleted))
+            except sqlite3.Error as e:
+                print("Unable to compact the jobs history: {}".format(e))
+            self.stopRequest.wait(self.interval)
+
+    def join(self, timeout=None):
+        """Called when the EFS is being shut down, stopping the Thread safely"""
+
+        self.stopRequest.set()
+        super(HistoryCompactor, self).join(timeout)
@@ -0,0 +1,117 @@
+""" The Idle Sampler for Edge Fair Scheduler
+
+This class samples the CPU usage of the running jobs at a fixed
+interval in the background. The samples of each job are kept in a
+ring buffer covering the idle period, and a job is reported as idle
+once its CPU usage has stayed below the idle threshold for every
+interval of the whole period.
+"""
+
+import threading
+import time
+import psutil
+import docker
+from collections import deque
+
+
+class IdleSampler(threading.Thread):
+
+    def __init__(self, collect, report, threshold, period, interval):
+        """Variable initialisation for the class
+
+        Parameters:
+            collect (function): Returns the CPU statistics of the running jobs keyed by job ID
+            report (function): Called with the list of idle jobs
+            threshold (float): The CPU usage percentage a job must stay below to be idle
+            period (float): The number of seconds a job must stay below the threshold to be idle
+            interval (float): The number of seconds between samples
+
+        """
+
+        super(IdleSampler, self).__init__(daemon=True)
+        self.stopRequest = threading.Event()
+
+        self.collect = collect
+        self.report = report
+        self.threshold = threshold
+        self.interval = interval
+
+        # one sample more than the number of intervals in the idle period
+        self.size = max(int(round(period / interval)), 1) + 1
+
+        # ring buffers of (total, system) CPU times per job ID
+        self.samples = {}
+
+    def percentage(self, current, previous):
+        """Calculates the average CPU usage percentage of a job between two samples
+
+        Parameters:
+            current (tuple): The later sample
+            previous (tuple): The earlier sample
+
+        Returns:
+            float: The CPU usage percentage
+        """
+
+        total_delta = current[0] - previous[0]
+        system_delta = current[1] - previous[1]
+        if total_delta > 0.0 and system_delta > 0.0:
+            return (total_delta / system_delta) * 100.0 * psutil.cpu_count()
+        return 0.0
+
+    def is_idle(self, samples):
+        """Checks if a job has stayed below the idle threshold for the whole idle period
+
+        Parameters:
+            samples (deque): The ring buffer of the job
+
+        Returns:
+            bool: True/False whether the job is idle
+        """
+
+        if len(samples) < self.size:
+            return False  # not sampled for long enough yet
+
+        for i in range(1, len(samples)):
+            if self.percentage(samples[i], samples[i - 1]) >= self.threshold:
+                return False
+        return True
+
+    def sample(self):
+        """Takes a sample of every running job and reports the jobs which have become idle"""
+
+        stats = self.collect()
+
+        # forget jobs which are no longer running
+        for job_id in [j for j in self.samples if j not in stats]:
+            del self.samples[job_id]
+
+        idle = []
+        for job_id, times in stats.items():
+            samples = self.samples.setdefault(job_id, deque(maxlen=self.size))
+            samples.append((times['total'], times['system']))
+
+            if self.is_idle(samples):
+                idle.append(job_id)
+                samples.clear()  # a job still running after being reported needs a full period again
+
+        if len(idle) > 0:
+            self.report(idle)
+
+    def run(self):
+        """Samples the running jobs at a fixed interval"""
+
+        while not self.stopRequest.is_set():
+            start = time.time()
+            try:
+                self.sample()
+            except (docker.errors.APIError, OSError) as e:
+                print("Unable to sample containers: {}".format(e))
+
+            self.stopRequest.wait(max(self.interval - (time.time() - start), 0))
+
+    def join(self, timeout=None):
+        """Called when the EFS is being shut down, stopping the Thread safely"""
+
+        self.stopRequest.set()
+        super(IdleSampler, self).join(timeout)
@@ -0,0 +1,365 @@
+""" The Job Queue for Edge Fair Scheduler
+
+This class keeps an in-memory copy of the job_queue table which
+the scheduling policies select jobs from. Queued jobs are indexed
+by priority, client and client and priority in heaps ordered by
+arrival, and waiting clients are kept in heaps ordered by their
+fair share count. The database remains the durable record of the
+queue and EFS keeps this copy in sync whenever it changes.
+"""
+
+import heapq
+import threading
+from collections import Counter
+
+
+class JobQueue:
+
+    def __init__(self, fair_share):
+        """Variable initialisation for the class
+
+        Parameters:
+            fair_share (FairShare): The fair share index used to order waiting clients
+
+        """
+
+        self.lock = threading.RLock()
+        self.fair_share = fair_share
+
+        # queued jobs keyed by job ID
+        self.jobs = {}
+
+        # heaps of (timestamp, job ID) per priority, client and (client, priority)
+        self.by_priority = {}
+        self.by_client = {}
+        self.by_client_priority = {}
+
+        # number of queued jobs per priority, client and (client, priority)
+        self.priority_sizes = Counter()
+        self.client_sizes = Counter()
+        self.client_priority_sizes = Counter()
+
+        # heaps of (count, client) over all waiting clients and over waiting clients per priority
+        self.clients = []
+        self.priority_clients = {}
+        self.generation = fair_share.generation
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def load(self, cur):
+        """Loads all queued jobs from the job_queue table
+
+        Parameters:
+            cur (Cursor): Database cursor
+
+        """
+
+        cur.execute("SELECT * FROM job_queue")
+        with self.lock:
+            for job in cur.fetchall():
+                self.add(job)
+
+    def add(self, job):
+        """Adds a queued job
+
+        Parameters:
+            job (list): The job_queue record of the job
+
+        """
+
+        with self.lock:
+            if job[0] in self.jobs:
+                return
+
+            job_id, client, priority = job[0], job[1], job[4]
+            entry = (job[5], job_id)
+            self.jobs[job_id] = tuple(job)
+
+            heapq.heappush(self.by_priority.setdefault(priority, []), entry)
+            heapq.heappush(self.by_client.setdefault(client, []), entry)
+            heapq.heappush(self.by_client_priority.setdefault((client, priority), []), entry)
+
+            self.priority_sizes[priority] += 1
+            self.client_sizes[client] += 1
+            self.client_priority_sizes[(client, priority)] += 1
+
+            # a client which was not waiting before needs an up to date entry in the client heaps
+            if self.client_sizes[client] == 1:
+                self.push_client(client)
+            if self.client_priority_sizes[(client, priority)] == 1:
+                self.push_client_priority(client, priority)
+
+    def remove(self, job_id):
+        """Removes a queued job, the heap entries are dropped once they reach the top
+
+        Parameters:
+            job_id (int): The ID of the job
+
+        Returns:
+            list/None: The removed job or None if it was not queued
+
+        """
+
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+            if job is None:
+                return None
+
+            client, priority = job[1], job[4]
+            self.decrement(self.priority_sizes, priority)
+            self.decrement(self.client_sizes, client)
+            self.decrement(self.client_priority_sizes, (client, priority))
+            return job
+
+    def take(self, job_id):
+        """Removes a job which is being started and records it in the fair share index
+
+        Parameters:
+            job_id (int): The ID of the job
+
+        Returns:
+            list: The job
+
+        """
+
+        with self.lock:
+            job = self.remove(job_id)
+            self.fair_share.record(job[1], job[4], job[5])
+            self.refresh(job[1], job[4])
+            return job
+
+    def untake(self, job, requeue=True):
+        """Reverts a job being taken, used when it could not be moved to the jobs history table
+
+        Parameters:
+            job (list): The job
+            requeue (bool): Whether the job should be queued again
+                (default is True)
+
+        """
+
+        with self.lock:
+            self.fair_share.discard(job[1], job[4], job[5])
+            if requeue:
+                self.add(job)
+            self.refresh(job[1], job[4])
+
+    def decrement(self, sizes, key):
+        """Decrements a queue size counter, dropping it once it reaches zero
+
+        Parameters:
+            sizes (Counter): The queue size counters
+            key: The counter to decrement
+
+        """
+
+        sizes[key] -= 1
+        if sizes[key] <= 0:
+            del sizes[key]
+
+    def push_client(self, client):
+        """Pushes the current fair share count of a client onto the client heap
+
+        Parameters:
+            client (str): Name of the client
+
+        """
+
+        heapq.heappush(self.clients, (self.fair_share.client_count(client), client))
+
+    def push_client_priority(self, client, priority):
+        """Pushes the current fair share count of a client and priority onto the heap of the priority
+
+        Parameters:
+            client (str): Name of the client
+            priority (int): The job priority
+
+        """
+
+        heap = self.priority_clients.setdefault(priority, [])
+        heapq.heappush(heap, (self.fair_share.client_priority_count(client, priority), client))
+
+    def refresh(self, client, priority):
+        """Updates the client heaps after the fair share count of a client has changed
+
+        Parameters:
+            client (str): Name of the client
+            priority (int): The job priority
+
+        """
+
+        if client in self.client_sizes:
+            self.push_client(client)
+        if (client, priority) in self.client_priority_sizes:
+            self.push_client_priority(client, priority)
+
+    def rebuild_clients(self):
+        """Rebuilds the client heaps from the waiting clients, used when fair share counts expire"""
+
+        self.generation = self.fair_share.generation
+        self.clients = [(self.fair_share.client_count(c), c) for c in self.client_sizes]
+        heapq.heapify(self.clients)
+
+        self.priority_clients = {}
+        for client, priority in self.client_priority_sizes:
+            count = self.fair_share.client_priority_count(client, priority)
+            self.priority_clients.setdefault(priority, []).append((count, client))
+        for heap in self.priority_clients.values():
+            heapq.heapify(heap)
+
+    def oldest(self, heaps, key):
+        """Gets the oldest queued job from one of the arrival ordered heaps
+
+        Parameters:
+            heaps (dict): The heaps to look in
+            key: The key of the heap
+
+        Returns:
+            list/None: The oldest job or None if there are none
+
+        """
+
+        heap = heaps.get(key)
+        while heap:
+            job = self.jobs.get(heap[0][1])
+            if job is not None:
+                return job
+            heapq.heappop(heap)  # job is no longer queued
+
+        heaps.pop(key, None)
+        return None
+
+    def oldest_job(self):
+        """Gets the oldest job in the queue
+
+        Returns:
+            list/None: The oldest job or None if the queue is empty
+
+        """
+
+        jobs = [self.oldest(self.by_priority, p) for p in list(self.priority_sizes)]
+        jobs = [job for job in jobs if job is not None]
+        if len(jobs) == 0:
+            return None
+        return min(jobs, key=lambda job: (job[5], job[0]))
+
+    def oldest_priority_job(self, priority):
+        """Gets the oldest queued job with a priority
+
+        Parameters:
+            priority (int): The job priority
+
+        Returns:
+            list/None: The oldest job or None if there are none
+
+        """
+
+        return self.oldest(self.by_priority, priority)
+
+    def oldest_client_job(self, client):
+        """Gets the oldest queued job of a client
+
+        Parameters:
+            client (str): Name of the client
+
+        Returns:
+            list/None: The oldest job or None if there are none
+
+        """
+
+        return self.oldest(self.by_client, client)
+
+    def oldest_client_priority_job(self, client, priority):
+        """Gets the oldest queued job of a client with a priority
+
+        Parameters:
+            client (str): Name of the client
+            priority (int): The job priority
+
+        Returns:
+            list/None: The oldest job or None if there are none
+
+        """
+
+        return self.oldest(self.by_client_priority, (client, priority))
+
+    def waiting_priorities(self):
+        """Gets the priorities of the queued jobs
+
+        Returns:
+            list: The waiting priorities
+
+        """
+
+        return list(self.priority_sizes)
+
+    def least_served_client(self, priority=None):
+        """Gets the waiting client with the fewest jobs run within the fairness window,
+        ties are broken by client name
+
+        Parameters:
+            priority (int): Only consider jobs of this priority
+                (default is None)
+
+        Returns:
+            str/None: The client name or None if there are no waiting clients
+
+        """
+
+        # counts dropping out of the window change the order of the heaps
+        self.fair_share.expire()
+        if self.generation != self.fair_share.generation:
+            self.rebuild_clients()
+
+        if priority is None:
+            heap = self.clients
+            waiting = self.client_sizes
+            count = self.fair_share.client_count
+        else:
+            heap = self.priority_clients.get(priority, [])
+            waiting = self.client_priority_sizes
+            count = lambda c: self.fair_share.client_priority_count(c, priority)
+
+        # drop entries for clients no longer waiting or whose count has since changed
+        while heap:
+            c = heap[0][1]
+            if (c if priority is None else (c, priority)) in waiting and heap[0][0] == count(c):
+                break
+            heapq.heappop(heap)
+
+        # keep stale entries from building up
+        if len(heap) > 2 * len(waiting) + 64:
+            self.rebuild_clients()
+            heap = self.clients if priority is None else self.priority_clients.get(priority, [])
+
+        if not heap:
+            return None
+        return heap[0][1]
+
+    def depths(self):
+        """Gets the number of queued jobs of each client with each priority
+
+        Returns:
+            dict: Number of queued jobs keyed by (priority, client)
+
+        """
+
+        with self.lock:
+            return {(p, c): n for (c, p), n in self.client_priority_sizes.items()}
+
+    def size(self, client=None):
+        """Gets the number of queued jobs
+
+        Parameters:
+            client (str): Only count the jobs of this client
+                (default is None)
+
+        Returns:
+            int: Number of queued jobs
+
+        """
+
+        if client is None:
+            return len(self.jobs)
+        return self.client_sizes[client]
@@ -0,0 +1,73 @@
+""" The Load Sampler for Edge Fair Scheduler
+
+This class samples the CPU and RAM usage of the host at a fixed
+interval in the background and keeps an exponentially weighted
+moving average of both, so the scheduler can check the real load of
+the node without measuring it on every decision. Load from outside
+EFS, which the resource ledger cannot see, is picked up this way.
+"""
+
+import threading
+import psutil
+
+
+class LoadSampler(threading.Thread):
+
+    def __init__(self, interval=1.0, smoothing=0.3):
+        """Variable initialisation for the class
+
+        Parameters:
+            interval (float): The number of seconds between samples
+                (default is 1.0)
+            smoothing (float): The weight given to each new sample, between 0 and 1
+                (default is 0.3)
+
+        """
+
+        super(LoadSampler, self).__init__(daemon=True)
+        self.stopRequest = threading.Event()
+        self.ready = threading.Event()  # set once the averages hold a real reading
+        self.interval = interval
+        self.smoothing = smoothing
+
+        # a first CPU reading has nothing to compare against and is always 0, so it only starts the
+        # measurement, the average starts from the first reading of the sampler thread
+        psutil.cpu_percent()
+        self.cpu = 0.0
+        self.memory = psutil.virtual_memory().available / 1024 / 1024
+
+    def sample(self):
+        """Takes a sample of the host load and folds it into the averages"""
+
+        cpu = psutil.cpu_percent()
+        memory = psutil.virtual_memory().available / 1024 / 1024
+
+        self.cpu += self.smoothing * (cpu - self.cpu)
+        self.memory += self.smoothing * (memory - self.memory)
+
+    def available(self):
+        """Gets the average CPU and RAM available on the host
+
+        Returns:
+            tuple: The percentage of CPU and megabytes of RAM available
+
+        """
+
+        return 100 - self.cpu, self.memory
+
+    def run(self):
+        """Samples the host load at a fixed interval, the first sample replacing the averages"""
+
+        if not self.stopRequest.wait(self.interval):
+            self.cpu = psutil.cpu_percent()
+            self.memory = psutil.virtual_memory().available / 1024 / 1024
+        self.ready.set()
+
+        while not self.stopRequest.wait(self.interval):
+            self.sample()
+
+    def join(self, timeout=None):
+        """Called when the EFS is being shut down, stopping the Thread safely"""
+
+        self.stopRequest.set()
+        super(LoadSampler, self).join(timeout)
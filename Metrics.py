@@ -0,0 +1,263 @@
+""" The Metrics for Edge Fair Scheduler
+
+This module holds the metrics EFS exposes in the Prometheus text
+format over a local HTTP endpoint. Counters and histograms are
+updated by the components as events happen and only take a lock
+and an addition, so they can be used on the hot paths. Gauges are
+read from the components through functions when the metrics are
+scraped.
+"""
+
+import bisect
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+# registered metrics in the order they are exposed
+METRICS = []
+
+# default histogram buckets in seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_labels(names, values, extra=''):
+    """Formats the labels of a sample
+
+    Parameters:
+        names (list): The label names
+        values (tuple): The label values
+        extra (str): An additional formatted label
+            (default is '')
+
+    Returns:
+        str: The formatted labels
+    """
+
+    labels = ['{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+              for n, v in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def format_value(value):
+    """Formats the value of a sample
+
+    Parameters:
+        value (float): The value
+
+    Returns:
+        str: The formatted value
+    """
+
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+
+    def __init__(self, name, description, labels=(), kind='untyped'):
+        """Variable initialisation for the class, registering the metric
+
+        Parameters:
+            name (str): Name of the metric
+            description (str): Help text of the metric
+            labels (tuple): Names of the labels of the metric
+                (default is no labels)
+            kind (str): The Prometheus type of the metric
+                (default is 'untyped')
+
+        """
+
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.kind = kind
+        self.lock = threading.Lock()
+        METRICS.append(self)
+
+    def samples(self):
+        """Gets the samples of the metric
+
+        Returns:
+            list: Lines of the samples in the text format
+        """
+
+        raise NotImplementedError
+
+    def render(self):
+        """Gets the metric in the text format
+
+        Returns:
+            str: The formatted metric
+        """
+
+        lines = ['# HELP {} {}'.format(self.name, self.description), '# TYPE {} {}'.format(self.name, self.kind)]
+        return '\n'.join(lines + self.samples())
+
+
+class Counter(Metric):
+
+    def __init__(self, name, description, labels=()):
+        super(Counter, self).__init__(name, description, labels, 'counter')
+        self.values = {}
+
+    def inc(self, *values, amount=1):
+        """Increments the counter
+
+        Parameters:
+            values (str): The label values
+            amount (float): Amount to increment by
+                (default is 1)
+
+        """
+
+        with self.lock:
+            self.values[values] = self.values.get(values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        if len(values) == 0 and len(self.labels) == 0:
+            values = [((), 0)]
+        return ['{}{} {}'.format(self.name, format_labels(self.labels, k), format_value(v)) for k, v in values]
+
+
+class Histogram(Metric):
+
+    def __init__(self, name, description, buckets=BUCKETS):
+        super(Histogram, self).__init__(name, description, (), 'histogram')
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Records an observation
+
+        Parameters:
+            value (float): The observed value
+
+        """
+
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append('{}_bucket{{le="{}"}} {}'.format(self.name, format_value(bound), cumulative))
+        lines.append('{}_sum {}'.format(self.name, format_value(total)))
+        lines.append('{}_count {}'.format(self.name, cumulative))
+        return lines
+
+
+class Gauge(Metric):
+
+    def __init__(self, name, description, labels=(), collect=None):
+        """Variable initialisation for the class
+
+        Parameters:
+            name (str): Name of the metric
+            description (str): Help text of the metric
+            labels (tuple): Names of the labels of the metric
+                (default is no labels)
+            collect (function): Returns the value, or a dictionary of values keyed by label values
+                (default is None, which exposes nothing until set)
+
+        """
+
+        super(Gauge, self).__init__(name, description, labels, 'gauge')
+        self.collect = collect
+
+    def samples(self):
+        if self.collect is None:
+            return []
+
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = []
+        for k, v in sorted(values.items()):
+            k = k if isinstance(k, tuple) else (k,)
+            lines.append('{}{} {}'.format(self.name, format_labels(self.labels, k), format_value(v)))
+        return lines
+
+
+def render():
+    """Gets all registered metrics in the text format
+
+    Returns:
+        str: The formatted metrics
+    """
+
+    return '\n'.join(m.render() for m in METRICS) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        """Serves the metrics"""
+
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are not logged
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+# metrics updated by the EFS components
+REQUESTS_REFUSED = Counter('efs_requests_refused_total', 'Requests refused by EFS', ('reason',))
+SCHEDULING_LATENCY = Histogram('efs_scheduling_decision_seconds', 'Time taken by the policy to select a job')
+START_LATENCY = Histogram('efs_container_start_seconds',
+                          'Time from a job being dispatched until its container is running with SSH set up')
+TERMINATION_LATENCY = Histogram('efs_termination_seconds', 'Time taken to stop and remove a container')
+DOCKER_ERRORS = Counter('efs_docker_errors_total', 'Errors returned by the Docker API', ('component',))
+DOCKER_RECONNECTS = Counter('efs_docker_reconnects_total', 'Reconnections to the Docker events stream')
+
+# metrics read from the EFS components once they are started
+QUEUE_DEPTH = Gauge('efs_queue_depth', 'Queued jobs per priority and client', ('priority', 'client'))
+RUNNING_JOBS = Gauge('efs_running_jobs', 'Job containers running')
+MAX_JOBS = Gauge('efs_max_jobs', 'Maximum number of jobs allowed to run')
+CLIENT_SHARE = Gauge('efs_client_share', 'Share of the jobs run within the fairness window per client',
+                     ('client',))
+PRIORITY_SHARE = Gauge('efs_priority_share', 'Share of the jobs run within the fairness window per priority',
+                       ('priority',))
+PRIORITY_TARGET = Gauge('efs_priority_target', 'Share of the jobs each priority should be given', ('priority',))
+
+
+def start_metrics_server(host, port):
+    """Starts serving the metrics over HTTP in the background
+
+    Parameters:
+        host (str): Address to listen on
+        port (int): Port to listen on
+
+    Returns:
+        MetricsServer: The server
+    """
+
+    server = MetricsServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
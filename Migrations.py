@@ -0,0 +1,134 @@
+""" The Database Migrations for Edge Fair Scheduler
+
+This module keeps the schema of the EFS database up to date.
+Each migration is applied once, in order, and the version
+reached is recorded in the user_version of the database so
+existing edge.db files are upgraded in place.
+"""
+
+
+def create_tables(cur):
+    """Creates the job, job queue and termination queue tables
+
+    Parameters:
+        cur (Cursor): Database cursor
+
+    """
+
+    # checks if tables exists in database, if not they are created
+    cur.execute("CREATE TABLE if not exists jobs(id INTEGER PRIMARY KEY,cust_name TEXT NOT NULL,cust_ip TEXT NOT NULL,"
+                "cust_port INTEGER,priority INTEGER,timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,ports TEXT NOT NULL);")
+    cur.execute("CREATE TABLE if not exists job_queue(id INTEGER PRIMARY KEY AUTOINCREMENT,cust_name TEXT NOT NULL,"
+                "cust_ip TEXT NOT NULL,cust_port INTEGER,priority INTEGER DEFAULT 1,"
+                "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,ports TEXT NOT NULL);")
+    cur.execute("CREATE TABLE if not exists term_queue(job_id INTEGER PRIMARY KEY, reason TEXT,"
+                " FOREIGN KEY(job_id) REFERENCES jobs(id));")
+
+    # if tables were only just created it updates the sequence to start at 1000
+    # required due to Docker not accepting value below for container ID
+    cur.execute("SELECT seq FROM SQLITE_SEQUENCE WHERE name='job_queue'")
+    if cur.fetchone() is None:
+        cur.execute("INSERT INTO SQLITE_SEQUENCE(name,seq) VALUES('job_queue', 1000)")
+
+
+def create_indexes(cur):
+    """Normalises the stored timestamps and creates the indexes used by the job selection queries
+
+    Parameters:
+        cur (Cursor): Database cursor
+
+    """
+
+    # store all timestamps as YYYY-MM-DD HH:MM:SS so they sort the same as datetime(timestamp)
+    cur.execute("UPDATE job_queue SET timestamp=datetime(timestamp) WHERE timestamp IS NOT datetime(timestamp)")
+    cur.execute("UPDATE jobs SET timestamp=datetime(timestamp) WHERE timestamp IS NOT datetime(timestamp)")
+
+    # indexes for selecting the oldest job overall, per priority, per client and per client and priority,
+    # these were dropped again by drop_queue_indexes once jobs were selected from the in-memory job queue
+    cur.execute("CREATE INDEX if not exists job_queue_timestamp ON job_queue(timestamp)")
+    cur.execute("CREATE INDEX if not exists job_queue_priority ON job_queue(priority, timestamp)")
+    cur.execute("CREATE INDEX if not exists job_queue_client ON job_queue(cust_name, timestamp)")
+    cur.execute("CREATE INDEX if not exists job_queue_client_priority ON job_queue(cust_name, priority, timestamp)")
+    cur.execute("CREATE INDEX if not exists job_queue_priority_client ON job_queue(priority, cust_name)")
+
+    # covering index for the fairness window of the jobs history
+    cur.execute("CREATE INDEX if not exists jobs_timestamp ON jobs(timestamp, cust_name, priority)")
+
+
+def create_job_counts(cur):
+    """Creates the table of daily job counts which old jobs history is rolled up into, and switches
+    the database to incremental vacuuming so the space freed by pruning the history can be reclaimed
+
+    Parameters:
+        cur (Cursor): Database cursor
+
+    """
+
+    cur.execute("CREATE TABLE if not exists job_counts(day TEXT NOT NULL,cust_name TEXT NOT NULL,priority INTEGER,"
+                "count INTEGER NOT NULL,PRIMARY KEY(day, cust_name, priority));")
+
+    # the vacuum mode of an existing database only changes once it has been rebuilt, which cannot be
+    # done within a transaction, and is only done here for an empty database so startup is never held up
+    # by rebuilding a large one, a large database keeps reusing its free pages rather than returning them
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cur.execute("SELECT EXISTS (SELECT 1 FROM jobs)")
+    if cur.fetchone()[0] == 0:
+        cur.connection.commit()
+        cur.execute("VACUUM")
+
+
+def drop_queue_indexes(cur):
+    """Drops the job queue indexes, which no longer serve any query now that jobs are selected
+    from the in-memory job queue, and only slow down adding jobs
+
+    Parameters:
+        cur (Cursor): Database cursor
+
+    """
+
+    for index in ('job_queue_timestamp', 'job_queue_priority', 'job_queue_client', 'job_queue_client_priority',
+                  'job_queue_priority_client'):
+        cur.execute("DROP INDEX if exists {}".format(index))
+
+
+# migrations in the order they are applied, the schema version is the number applied
+MIGRATIONS = [
+    create_tables,
+    create_indexes,
+    create_job_counts,
+    drop_queue_indexes,
+]
+
+
+def get_version(cur):
+    """Gets the schema version of the database
+
+    Parameters:
+        cur (Cursor): Database cursor
+
+    Returns:
+        int: The schema version
+
+    """
+
+    cur.execute("PRAGMA user_version")
+    return cur.fetchone()[0]
+
+
+def migrate(db):
+    """Applies any migrations the database has not yet been through
+
+    Parameters:
+        db (Connection): Database connection
+
+    """
+
+    cur = db.cursor()
+    version = get_version(cur)
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        # apply each migration in its own transaction along with the version bump
+        migration(cur)
+        cur.execute("PRAGMA user_version = {}".format(number))
+        db.commit()
+        print('Database migrated to version {}'.format(number))
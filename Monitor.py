@@ -1,7 +1,8 @@
 """ The Monitor for Edge Fair Scheduler
 
 This class is responsible for monitoring the resource usage of all
-running containers and terminating any idle ones. It also terminates
+running containers and terminating any idle ones, which are detected
+in the background by the idle sampler. It also terminates
 any jobs which have been requested for termination by the clients.
 
 Arkadiusz Madej
@@ -11,25 +12,76 @@ import docker
 import time
 import datetime
 import threading
-import sqlite3
-import psutil
 import ssl
 import socket
-import struct
-import json
+import Protocol
+from concurrent.futures import ThreadPoolExecutor
+from CgroupStats import CgroupStats
+from IdleSampler import IdleSampler
+from ContainerRegistry import ContainerRegistry
+from Database import Database
+from Metrics import TERMINATION_LATENCY, DOCKER_ERRORS
 
 
 class Monitor(threading.Thread):
 
-    def __init__(self):
-        """Variable initialisation for the class"""
+    def __init__(self, scheduler=None, idleThreshold=10.0, idlePeriod=120.0, sampleInterval=10.0, wakeInterval=1.0,
+                 stopTimeout=10, terminateWorkers=8, registry=None, database=None):
+        """Variable initialisation for the class
+
+        Parameters:
+            scheduler (Scheduler): The scheduler to notify when containers are stopped
+                (default is None)
+            idleThreshold (float): The CPU usage percentage a job must stay below to be idle
+                (default is 10.0)
+            idlePeriod (float): The number of seconds a job must stay below the threshold to be idle
+                (default is 120.0)
+            sampleInterval (float): The number of seconds between CPU usage samples
+                (default is 10.0)
+            wakeInterval (float): Longest time to wait before checking the termination queue
+                (default is 1.0)
+            stopTimeout (int): The number of seconds a container is given to stop before it is killed
+                (default is 10)
+            terminateWorkers (int): The number of containers which can be stopped at the same time
+                (default is 8)
+            registry (ContainerRegistry): The registry of running containers, shared with the scheduler
+                (default is None which starts a registry of its own)
+            database (Database): The pool of database connections, shared with the scheduler
+                (default is None which opens a pool of its own on edge.db)
+
+        """
 
         super(Monitor, self).__init__()
         self.stopRequest = threading.Event()
-        self.dockr = docker.from_env()
-        self.dockr_client = docker.APIClient(base_url='unix://var/run/docker.sock')
-        self.db = None
-        self.db_cur = None
+        self.wakeRequest = threading.Event()
+        self.wakeInterval = wakeInterval
+        self.scheduler = scheduler
+        # running containers are read from the registry, which also provides the Docker client
+        if registry is None:
+            registry = ContainerRegistry()
+            registry.start()
+        self.registry = registry
+        self.dockr = registry.dockr
+        self.database = Database() if database is None else database
+
+        # the time each job container was first seen running
+        self.first_seen = {}
+
+        # reads container statistics from the cgroup filesystem
+        self.cgroups = CgroupStats()
+
+        # idle jobs reported by the sampler which are still to be queued for termination
+        self.idle = set()
+        self.idleLock = threading.Lock()
+        self.sampler = IdleSampler(self.get_cpu_stats, self.jobs_idle, idleThreshold, idlePeriod, sampleInterval)
+
+        # containers are stopped by a pool of workers, the IDs of the jobs being terminated are kept
+        # so they are not handed out twice, and the workers hand back (job ID, stopped) once done
+        self.terminators = ThreadPoolExecutor(max_workers=terminateWorkers)
+        self.stopTimeout = stopTimeout
+        self.terminating = set()
+        self.terminated = []
+        self.terminatedLock = threading.Lock()
 
         self.server_cert = 'certs/server.crt'
         self.server_key = 'certs/server.key'
@@ -43,79 +95,101 @@ class Monitor(threading.Thread):
 
         """
 
+        # a job may already be queued for termination at the request of the client
+        self.database.queue_terminations(containers, 'Container Idle').result()
         for container in containers:
-            self.db_cur.execute("INSERT INTO term_queue (job_id,  reason) VALUES (?,?)", (container, 'Container Idle'))
             print("Kill job {}".format(container))
-        self.db.commit()
 
     def terminate_jobs(self):
-        """Called periodically in order to stop any containers listed in the termination queue"""
+        """Called periodically in order to stop any containers listed in the termination queue,
+        the containers are stopped in parallel by the termination workers"""
+
+        # remove the jobs which have been terminated from the queue in one go, failed ones are tried again
+        with self.terminatedLock:
+            terminated = self.terminated
+            self.terminated = []
+        done = [job_id for job_id, stopped in terminated if stopped]
+        if len(done) > 0:
+            self.database.remove_terminations(done).result()
+        self.terminating.difference_update(job_id for job_id, stopped in terminated)
+
+        # gets all termination request from queue along with the client of the job
+        for c in self.database.get_terminations():
+            if c[0] not in self.terminating:
+                self.terminating.add(c[0])
+                self.terminators.submit(self.terminate_job, c)
+
+    def terminate_job(self, request):
+        """Called by a termination worker to stop a container and notify the client
 
-        # gets all termination request from queue
-        self.db_cur.execute("SELECT * FROM term_queue")
-        containers = self.db_cur.fetchall()
+        Parameters:
+            request (list): The job ID, reason and the client name, IP and port
 
-        # if queue not empty start terminating
-        if len(containers) > 0:
-            for c in containers:
-                container = None
-                try:
-                    print("Stopping {}".format(c[0]))
-                    container = self.dockr.containers.get(str(c[0]))
-                except docker.errors.APIError:
-                    self.dockr = docker.from_env()
-                    print("Job is already stopped or never existed")
+        """
 
+        stopped = False
+        try:
+            print("Stopping {}".format(request[0]))
+            # the container is still being started, so the termination is tried again on a later pass,
+            # this is checked first as a job is only done provisioning once its container is registered
+            if self.scheduler is not None and self.scheduler.is_provisioning(request[0]):
+                print("Job {} is still being provisioned".format(request[0]))
+                return
+            container = self.registry.get(str(request[0]))
+            if container is None:
+                print("Job is already stopped or never existed")
+            else:
                 # stop and remove container
-                if container is not None:
-                    container.stop()
-                    container.remove(v=True)
-
-                # once job terminate remove from queue and notify client
-                self.db_cur.execute("DELETE FROM term_queue WHERE job_id=?", (c[0],))
-                self.db.commit()
-                if container is not None:
-                    self.notify_client(c[0], c[1])
-
-    def notify_client(self, id, reason):
+                start = time.perf_counter()
+                try:
+                    self.dockr.api.stop(container.id, timeout=self.stopTimeout)
+                    self.dockr.api.remove_container(container.id, v=True)
+                except docker.errors.NotFound:
+                    pass  # stopped in the meantime
+                TERMINATION_LATENCY.observe(time.perf_counter() - start)
+            stopped = True
+
+            # let the scheduler release the resources of the job straight away
+            if self.scheduler is not None:
+                self.scheduler.job_finished(request[0])
+
+            if container is not None and request[2] is not None:
+                self.notify_client(request)
+        except docker.errors.APIError as e:
+            DOCKER_ERRORS.inc('monitor')
+            print("Unable to terminate job {}: {}".format(request[0], e))
+        except OSError as e:
+            print("Unable to terminate job {}: {}".format(request[0], e))
+        finally:
+            # the job is removed from the queue by the monitor thread
+            with self.terminatedLock:
+                self.terminated.append((request[0], stopped))
+            self.notify()
+
+    def notify_client(self, request):
         """Used to notify the client that a container has been stopped
 
         Parameters:
-            id (int): Client ID
-            reason (str): Reason for terminating job
+            request (list): The job ID, reason and the client name, IP and port
 
         """
 
-        # get client information based on job ID
-        self.db_cur.execute("SELECT * FROM jobs WHERE id=?", (id,))
-        job = self.db_cur.fetchone()
-
         # set up secure communication with client using SSL
-        context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile='certs/'+job[1]+'.crt')
+        context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile='certs/'+request[2]+'.crt')
         context.load_cert_chain(certfile=self.server_cert, keyfile=self.server_key)
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        conn = context.wrap_socket(s, server_side=False, server_hostname=job[1])
-        conn.connect((job[2], job[3]))
+        s.settimeout(self.stopTimeout)
+        conn = context.wrap_socket(s, server_side=False, server_hostname=request[2])
+        conn.connect((request[3], request[4]))
 
         # send notification to client
-        msg_dict = {'Msg': 'Terminated', 'JobID': id, 'Reason': reason}
-        self.send_msg(json.dumps(msg_dict), conn)
+        msg_dict = {'Msg': 'Terminated', 'JobID': request[0], 'Reason': request[1]}
+        Protocol.send_msg(msg_dict, conn, Protocol.client_version(request[2]))
         conn.close()
 
-    def send_msg(self, msg, conn):
-        """Sends a structured message containing the message length at the start
-
-        Parameters:
-            msg (str): The message to be sent
-            conn (socket): HTTP socket connection
-
-        """
-
-        msg = struct.pack('>I', len(msg)) + msg.encode('ascii')
-        conn.sendall(msg)
-
     def get_cpu_stats(self):
-        """Collects the CPU statistics for all containers running for over a minute
+        """Collects the CPU statistics for all containers running for over a minute, reading them from
+        the cgroup filesystem where possible and from the Docker stats API otherwise
 
         Returns:
               dict: A dictionary of the collected CPU statistics
@@ -123,111 +197,90 @@ class Monitor(threading.Thread):
         """
 
         jobs = {}
-        for c in self.dockr_client.containers():
+        seen = {}
+        containers = self.registry.containers()
+        self.cgroups.forget(set(c.id for c in containers))
+
+        # the host CPU time is read once for all containers read from the cgroup filesystem
+        try:
+            system = self.cgroups.system_usage()
+        except (OSError, ValueError):
+            system = None
+
+        for c in containers:
             times = {}
 
-            # calculate how long container has been running for
-            start = c['Created']
-            uptime = datetime.datetime.now() - datetime.datetime.fromtimestamp(start)
+            # only job containers are checked, these are named after the job ID
+            name = c.name
+            if not name.isdigit():
+                continue
+
+            # calculate how long container has been running for as a job, pooled containers are
+            # created ahead of time so the time they were first seen running as a job is used
+            seen[name] = self.first_seen.get(name, datetime.datetime.now())
+            uptime = datetime.datetime.now() - seen[name]
 
             if uptime.total_seconds() > 60:  # only check jobs running for over a minute
 
                 # get CPU statistics for container
-                container = self.dockr.containers.get(c['Id'])
-                stats = container.stats(stream=False)
-                total = float(stats['cpu_stats']['cpu_usage']['total_usage'])
-                system = float(stats['cpu_stats']['system_cpu_usage'])
-
-                # add statistics to dictionary and then append it to jobs list
-                times['total'] = total
-                times['system'] = system
-                jobs[int(container.name)] = times
-        return jobs
+                usage = None if system is None else self.cgroups.container_usage(c.id)
+                if usage is not None:
+                    times['total'], times['memory'] = usage
+                    times['system'] = system
+                else:
+                    stats = self.dockr.api.stats(c.id, stream=False)
+                    times['total'] = float(stats['cpu_stats']['cpu_usage']['total_usage'])
+                    times['system'] = float(stats['cpu_stats']['system_cpu_usage'])
+                    times['memory'] = int(stats.get('memory_stats', {}).get('usage', 0))
 
-    def calculate_percentages(self, current, previous):
-        """Given a set of CPU statistics it calculates the average CPU usage percentages
-        per container
+                # add statistics to dictionary
+                jobs[int(name)] = times
 
-        Parameters:
-            current (dict): Dictionary of current CPU statistics
-            previous (dict): Dictionary of previous CPU statistics
+        self.first_seen = seen
+        return jobs
 
-        Returns:
-              dict: A dictionary of CPU usage percentages
+    def notify(self):
+        """Wakes the monitor up when a job has been queued for termination"""
 
-        """
+        self.wakeRequest.set()
 
-        percentages = {}
-        for i in current:
-            if i in previous:  # only compare stats for containers which exist in both statistics lists
-                total_delta = current[i]['total'] - previous[i]['total']
-                system_delta = current[i]['system'] - previous[i]['system']
-
-                # calculate the average CPU usage percentage
-                if total_delta > 0.0 and system_delta > 0.0:
-                    percentages[i] = (total_delta/system_delta) * 100.0 * psutil.cpu_count()
-                else:
-                    percentages[i] = 0.0
-            else:
-                percentages[i] = 100.0
-        return percentages
-
-    def check_for_idle_containers(self, current, previous):
-        """Checks if any of the running containers are idle
+    def jobs_idle(self, jobs):
+        """Called by the idle sampler with the jobs which have become idle
 
         Parameters:
-            current (dict): Dictionary of current CPU statistics
-            previous (dict): Dictionary of previous CPU statistics
-
-        Returns:
-            list: A list of idle containers
+            jobs (list): List of idle job IDs
 
         """
 
-        percentages = self.calculate_percentages(current, previous)
-        containers = []
-        for i in percentages:
-            if percentages[i] < 10.0:  # if container uses less than 10% CPU queue for termination
-                containers.append(i)
-        return containers
+        with self.idleLock:
+            self.idle.update(jobs)
+        self.notify()
 
     def run(self):
-        """Main function responsible for the monitoring and termination of containers"""
-
-        # initiate db connection
-        self.db = sqlite3.connect('edge.db')
-        self.db_cur = self.db.cursor()
+        """Main function responsible for the termination of containers"""
 
-        timeout = datetime.datetime.now()
+        # idle jobs are detected in the background
+        self.sampler.start()
 
         while not self.stopRequest.is_set():
-            if datetime.datetime.now() >= timeout:
-                # gather CPU statistics for a 10 second period
-                try:
-                    previous = self.get_cpu_stats()
-                    time.sleep(10)
-                    current = self.get_cpu_stats()
-
-                    # using gathered stats check for idle containers
-                    idle = self.check_for_idle_containers(current, previous)
-                except docker.errors.APIError:
-                    # restart API connection if it breaks
-                    self.dockr = docker.from_env()
+            # sleep until notified, the timeout ensures termination requests are still picked up
+            self.wakeRequest.wait(self.wakeInterval)
+            self.wakeRequest.clear()
 
-                # queue any idle containers
-                if len(idle) > 0:
-                    self.queue_for_termination(idle)
-
-                # sleep for 2 minutes before checking again
-                timeout = datetime.datetime.now() + datetime.timedelta(minutes=2)
+            # queue any idle containers
+            with self.idleLock:
+                idle = list(self.idle)
+                self.idle.clear()
+            if len(idle) > 0:
+                self.queue_for_termination(idle)
 
             self.terminate_jobs()
 
-            # prevent overloading cpu when no jobs to terminate
-            time.sleep(1)
-
     def join(self, timeout=None):
         """Called when the EFS is being shut down, stopping the Thread safely"""
 
         self.stopRequest.set()
+        self.wakeRequest.set()
+        self.sampler.join()
         super(Monitor, self).join(timeout)
+        self.terminators.shutdown(wait=True)
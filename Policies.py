@@ -0,0 +1,218 @@
+""" The Scheduling Policies for Edge Fair Scheduler
+
+This module holds the registry of scheduling policies which select
+the next job to run from the in-memory job queue. Policies are
+registered under a name, and optionally the number used for them
+in the strategy setting of the config, which is then used to look
+them up. Additional policies can be registered by modules listed in
+the policies setting of the config.
+"""
+
+import importlib
+
+# default share of the jobs each priority should be given
+PRIORITY_WEIGHTED = {3: 0.5, 2: 0.35, 1: 0.15}
+
+# registered policies keyed by name
+POLICIES = {}
+
+
+def register(*names):
+    """Class decorator registering a policy under the given names
+
+    Parameters:
+        names (str): The names the policy can be selected by in config
+
+    Returns:
+        function: The decorator
+
+    """
+
+    def decorator(cls):
+        for name in names:
+            POLICIES[str(name).lower()] = cls
+        return cls
+    return decorator
+
+
+def load_policies(modules):
+    """Imports the modules providing additional policies so they can register themselves
+
+    Parameters:
+        modules (str): Module names separated by commas
+
+    """
+
+    for module in modules.split(','):
+        if module.strip():
+            importlib.import_module(module.strip())
+
+
+def parse_weights(value):
+    """Parses the share of the jobs each priority should be given
+
+    Parameters:
+        value (str): Priority and share pairs separated by commas, e.g. '3:0.5,2:0.35,1:0.15'
+
+    Returns:
+        dict/None: Share of the jobs keyed by priority or None if no pairs are given
+
+    Raises:
+        ValueError: If a pair is malformed
+
+    """
+
+    weights = {}
+    for pair in value.split(','):
+        if pair.strip():
+            priority, share = pair.split(':')
+            weights[int(priority)] = float(share)
+    return weights if weights else None
+
+
+def get_policy(name, weights=None):
+    """Creates the policy registered under the given name
+
+    Parameters:
+        name (str): Name of the policy
+        weights (dict): Share of the jobs each priority should be given
+            (default is None which uses PRIORITY_WEIGHTED)
+
+    Returns:
+        Policy: The policy
+
+    Raises:
+        KeyError: If no policy is registered under the name
+
+    """
+
+    return POLICIES[str(name).strip().lower()](weights)
+
+
+def get_next_priority(queue, fair_share, priority_weighted):
+    """Selects the next job priority to be scheduled
+
+    Parameters:
+        queue (JobQueue): The job queue
+        fair_share (FairShare): The fair share index
+        priority_weighted (dict): Dictionary of priority weightings
+
+    Returns:
+        int: The job priority
+
+    """
+
+    priority_freq = {}
+
+    #  get total number of previously run jobs
+    total_freq = fair_share.total_count()
+
+    # grab all waiting priorities
+    waiting_priorities = queue.waiting_priorities()
+
+    # calculate frequency of job execution per each waiting priority
+    for p in waiting_priorities:
+        count = fair_share.priority_count(p)
+
+        if count > 0 and total_freq > 0:
+            priority_freq[p] = count/total_freq
+        else:
+            priority_freq[p] = 0.0
+
+    # sort waiting priorities from highest to lowest
+    ordered = sorted(waiting_priorities, reverse=True)
+
+    return select_priority(ordered, priority_freq, priority_weighted)
+
+
+def select_priority(waiting, priority_freq, priority_weighted):
+    """ Selects the next job priority to be scheduled from the waiting list
+    based on the priority weightings
+
+    Parameters:
+        waiting (list): List of priorities in the job queue, from highest to lowest
+        priority_freq (dict): Dictionary of priority frequencies
+        priority_weighted (dict): Dictionary of priority weightings
+
+    Returns:
+        int: The job priority
+
+    """
+
+    for p in waiting:
+        if priority_freq[p] < priority_weighted[p]:
+            return p  # if priority under threshold then return it
+
+    return waiting[0]  # get highest priority in the case all are over their threshold
+
+
+class Policy:
+
+    def __init__(self, weights=None):
+        """Variable initialisation for the class
+
+        Parameters:
+            weights (dict): Share of the jobs each priority should be given
+                (default is None which uses PRIORITY_WEIGHTED)
+
+        """
+
+        self.priority_weighted = PRIORITY_WEIGHTED if weights is None else weights
+
+    def select(self, queue, fair_share):
+        """Selects the next job to run, the queue lock must be held by the caller
+
+        Parameters:
+            queue (JobQueue): The job queue, which must not be empty
+            fair_share (FairShare): The fair share index
+
+        Returns:
+            list: The next job to run
+
+        """
+
+        raise NotImplementedError
+
+
+@register('fcfs', 0)
+class FirstComeFirstServed(Policy):
+
+    def select(self, queue, fair_share):
+        """Selects the next job based on the time of request"""
+
+        # gets oldest job first
+        return queue.oldest_job()
+
+
+@register('client', 1)
+class ClientFair(Policy):
+
+    def select(self, queue, fair_share):
+        """Selects the next job based on client frequency"""
+
+        # get oldest job of the client which has had the fewest jobs run
+        return queue.oldest_client_job(queue.least_served_client())
+
+
+@register('priority', 2)
+class PriorityFair(Policy):
+
+    def select(self, queue, fair_share):
+        """Selects the next job based on job priority"""
+
+        # gets oldest job with the next priority to schedule
+        return queue.oldest_priority_job(get_next_priority(queue, fair_share, self.priority_weighted))
+
+
+@register('hybrid', 3)
+class Hybrid(Policy):
+
+    def select(self, queue, fair_share):
+        """Selects the next job based on job priority and client frequency"""
+
+        # get the next priority and the client which has had the fewest jobs of that priority run
+        next_priority = get_next_priority(queue, fair_share, self.priority_weighted)
+        next_client = queue.least_served_client(next_priority)
+
+        # gets oldest job entry for specified client and priority
+        return queue.oldest_client_priority_job(next_client, next_priority)
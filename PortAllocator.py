@@ -0,0 +1,137 @@
+""" The Port Allocator for Edge Fair Scheduler
+
+This class hands out the host ports of the configured range to the
+containers. It keeps a map of which ports are in use along with a
+list of the free ones, so ports are allocated without asking Docker
+which are used. Ports are reserved under the name of the container
+they are mapped for and are released once the container is gone.
+"""
+
+import threading
+from collections import deque
+
+
+class PortAllocator:
+
+    def __init__(self, lower, upper):
+        """Variable initialisation for the class
+
+        Parameters:
+            lower (int): The first port of the range
+            upper (int): The last port of the range
+
+        """
+
+        self.lower = lower
+        self.upper = upper
+        self.lock = threading.Lock()
+
+        # one entry per port in the range, set while the port is in use
+        self.used = bytearray(upper - lower + 1)
+
+        # free ports in the order they should be handed out, may hold ports since reserved
+        self.free = deque(range(lower, upper + 1))
+
+        # ports reserved per container name
+        self.reservations = {}
+
+    def allocate(self, name, num):
+        """Allocates a number of free ports to a container
+
+        Parameters:
+            name (str): Name of the container
+            num (int): Number of ports required
+
+        Returns:
+            list/None: The allocated ports or None if there are not enough free ports
+
+        """
+
+        with self.lock:
+            ports = []
+            while len(ports) < num and self.free:
+                port = self.free.popleft()
+                if not self.used[port - self.lower]:  # skip ports reserved directly since
+                    self.used[port - self.lower] = 1
+                    ports.append(port)
+
+            if len(ports) < num:
+                # not enough ports, give back the ones taken
+                self.put_back(ports)
+                return None
+
+            self.reservations.setdefault(name, []).extend(ports)
+            return ports
+
+    def reserve(self, name, ports):
+        """Reserves specific ports for a container, used for containers EFS did not just start
+
+        Parameters:
+            name (str): Name of the container
+            ports (list): The ports used by the container
+
+        """
+
+        with self.lock:
+            for port in ports:
+                if self.lower <= port <= self.upper and not self.used[port - self.lower]:
+                    self.used[port - self.lower] = 1
+                    self.reservations.setdefault(name, []).append(port)
+
+    def release(self, name):
+        """Releases all ports reserved for a container
+
+        Parameters:
+            name (str): Name of the container
+
+        """
+
+        with self.lock:
+            self.put_back(self.reservations.pop(name, []))
+
+    def transfer(self, name, new_name):
+        """Moves the ports reserved for a container to a new name, used when a container is renamed
+
+        Parameters:
+            name (str): Name the ports are reserved under
+            new_name (str): Name to reserve the ports under instead
+
+        """
+
+        with self.lock:
+            self.reservations.setdefault(new_name, []).extend(self.reservations.pop(name, []))
+
+    def put_back(self, ports):
+        """Marks ports as free again, the lock must be held by the caller
+
+        Parameters:
+            ports (list): The ports to free
+
+        """
+
+        for port in ports:
+            self.used[port - self.lower] = 0
+            self.free.append(port)  # reused last to give the old mapping time to clear
+
+    def reconcile(self, containers):
+        """Reserves the ports of the containers which are already running
+
+        Parameters:
+            containers (list): The records of the running containers
+
+        """
+
+        for c in containers:
+            self.reserve(c.name, c.ports)
+
+    def retain(self, names):
+        """Releases the ports of any containers which are no longer running
+
+        Parameters:
+            names (set): Names of the containers whose ports should be kept
+
+        """
+
+        with self.lock:
+            for name in [n for n in self.reservations if n not in names]:
+                self.put_back(self.reservations.pop(name))
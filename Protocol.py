@@ -0,0 +1,209 @@
+""" The Wire Protocol for Edge Fair Scheduler
+
+This module holds the framing of the messages exchanged between EFS
+and its clients, and is shared by EFS, the Scheduler, the Monitor and
+the client script. Every message is sent with its length as a 4 byte
+prefix. Version 1 of the protocol carries the messages as JSON. In
+version 2 they are packed with MessagePack, which makes messages
+smaller and faster to pack and parse. A client asks for version 2 by
+listing the versions it supports in the Protocol field of a request,
+and the reply names the version chosen. Clients which do not ask, or
+either side not having the msgpack package, keep to JSON. Messages
+are told apart by their first byte, as a JSON message always starts
+with '{', so either version can always be read.
+"""
+
+import asyncio
+import json
+import struct
+import threading
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# protocol versions
+JSON = 1
+BINARY = 2
+
+# versions supported, most preferred first
+VERSIONS = (BINARY, JSON) if msgpack is not None else (JSON,)
+
+# versions chosen by each client, so messages EFS starts itself are sent in a version the client reads
+client_versions = {}
+client_versions_lock = threading.Lock()
+
+
+def negotiate(request, client=None):
+    """Chooses the protocol version to reply to a request with
+
+    Parameters:
+        request (dict): The decoded request
+        client (str): Name of the client, which is remembered to use the version chosen
+            (default is None)
+
+    Returns:
+        int: The highest version supported by both sides, JSON if the client did not ask for any
+
+    """
+
+    offered = request.get('Protocol')
+    version = JSON
+    if isinstance(offered, list):
+        common = [v for v in VERSIONS if v in offered]
+        if common:
+            version = common[0]
+
+    if client is not None and offered is not None:
+        with client_versions_lock:
+            client_versions[client] = version
+    return version
+
+
+def client_version(client):
+    """Gets the protocol version a client last chose
+
+    Parameters:
+        client (str): Name of the client
+
+    Returns:
+        int: The version, JSON if the client has not chosen one
+
+    """
+
+    with client_versions_lock:
+        return client_versions.get(client, JSON)
+
+
+def encode(msg, version=JSON):
+    """Encodes a message
+
+    Parameters:
+        msg (dict): The message
+        version (int): The protocol version
+            (default is JSON)
+
+    Returns:
+        bytes: The encoded message
+
+    """
+
+    if version == BINARY and msgpack is not None:
+        return msgpack.packb(msg, use_bin_type=True)
+    return json.dumps(msg, separators=(',', ':')).encode('utf-8')
+
+
+def decode(data):
+    """Decodes a message of either version
+
+    Parameters:
+        data (bytes): The encoded message
+
+    Returns:
+        dict: The message, empty if it was not valid
+
+    """
+
+    if not data:
+        return {}
+
+    try:
+        if data[:1] in (b'{', b' ', b'\n', b'\r', b'\t'):
+            msg = json.loads(str(data, 'utf-8'))
+        elif msgpack is not None:
+            msg = msgpack.unpackb(data, raw=False)
+        else:
+            return {}
+    except (ValueError, TypeError):
+        return {}
+    return msg if isinstance(msg, dict) else {}
+
+
+def frame(msg, version=JSON):
+    """Encodes a message with its length at the start
+
+    Parameters:
+        msg (dict): The message
+        version (int): The protocol version
+            (default is JSON)
+
+    Returns:
+        bytes: The framed message
+
+    """
+
+    data = encode(msg, version)
+    return struct.pack('>I', len(data)) + data
+
+
+def send_msg(msg, conn, version=JSON):
+    """Sends a message containing the message length at the start
+
+    Parameters:
+        msg (dict): The message to be sent
+        conn (socket): Socket connection
+        version (int): The protocol version
+            (default is JSON)
+
+    """
+
+    conn.sendall(frame(msg, version))
+
+
+def recv_data(sock, msg_len):
+    """Receives data from a connection
+
+    Parameters:
+        sock (socket): Socket connection
+        msg_len (int): Length of the data to receive
+
+    Returns:
+        bytes: The data or None if the connection was closed
+
+    """
+
+    data = b''
+    while len(data) < msg_len:
+        packet = sock.recv(msg_len - len(data))
+        if not packet:
+            return None
+        data += packet
+    return data
+
+
+def recv_message(sock):
+    """Receives a message
+
+    Parameters:
+        sock (socket): Socket connection
+
+    Returns:
+        bytes: The undecoded message or None if the connection was closed
+
+    """
+
+    # First acquire the message length, then the full message
+    msg_len = recv_data(sock, 4)
+    if not msg_len:
+        return None
+    return recv_data(sock, struct.unpack('>I', msg_len)[0])
+
+
+async def recv_message_async(reader):
+    """Receives a message from an asyncio stream
+
+    Parameters:
+        reader (StreamReader): Stream of the connection
+
+    Returns:
+        bytes: The undecoded message or None if the connection was closed
+
+    """
+
+    try:
+        # First acquire the message length, then the full message
+        msg_len = struct.unpack('>I', await reader.readexactly(4))[0]
+        return await reader.readexactly(msg_len)
+    except asyncio.IncompleteReadError:
+        return None
@@ -0,0 +1,93 @@
+""" The Resource Ledger for Edge Fair Scheduler
+
+This class keeps account of the CPU and RAM committed on the edge
+node. The base service is committed from the start, and each job
+reserves a CPU and RAM unit when it is dispatched, which it holds
+until its container is gone. This lets the scheduler know how many
+more jobs fit without measuring the host, including jobs which were
+only just started and have yet to use their resources.
+"""
+
+import threading
+
+
+class ResourceLedger:
+
+    def __init__(self, totalCPU, totalMem, baseCPU, baseMem, unitCPU, unitMem):
+        """Variable initialisation for the class
+
+        Parameters:
+            totalCPU (int): The CPU of the node, one core is equal to the CPU scheduler period
+            totalMem (int): The RAM of the node in megabytes
+            baseCPU (int): The CPU required by the base service
+            baseMem (int): The RAM required by the base service in megabytes
+            unitCPU (int): The CPU unit reserved by each job
+            unitMem (int): The RAM unit reserved by each job in megabytes
+
+        """
+
+        self.lock = threading.Lock()
+        self.totalCPU = totalCPU
+        self.totalMem = totalMem
+        self.unitCPU = unitCPU
+        self.unitMem = unitMem
+
+        # resources committed so far, starting with those of the base service
+        self.committedCPU = baseCPU
+        self.committedMem = baseMem
+
+        # jobs holding a reservation
+        self.reservations = set()
+
+    def available(self):
+        """Gets the number of jobs the uncommitted resources have room for
+
+        Returns:
+            int: Number of jobs
+
+        """
+
+        with self.lock:
+            return int(min((self.totalCPU - self.committedCPU) // self.unitCPU,
+                           (self.totalMem - self.committedMem) // self.unitMem))
+
+    def reserve(self, name):
+        """Reserves the resources of a job
+
+        Parameters:
+            name (str): Name of the container of the job
+
+        """
+
+        with self.lock:
+            if name not in self.reservations:
+                self.reservations.add(name)
+                self.committedCPU += self.unitCPU
+                self.committedMem += self.unitMem
+
+    def release(self, name):
+        """Releases the resources of a job
+
+        Parameters:
+            name (str): Name of the container of the job
+
+        """
+
+        with self.lock:
+            if name in self.reservations:
+                self.reservations.discard(name)
+                self.committedCPU -= self.unitCPU
+                self.committedMem -= self.unitMem
+
+    def retain(self, names):
+        """Releases the resources of any jobs which are no longer running
+
+        Parameters:
+            names (set): Names of the containers whose resources should be kept
+
+        """
+
+        with self.lock:
+            gone = [n for n in self.reservations if n not in names]
+        for name in gone:
+            self.release(name)
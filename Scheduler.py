@@ -6,78 +6,134 @@ the scheduling of all the jobs on the edge node.
 Arkadiusz Madej
 """
 
-import random
 import threading
 import ssl
 import psutil
 import docker
 import socket
 import sqlite3
-import json
-import struct
-from tarfile import TarFile
+import tarfile
+import time
+import io
+import Protocol
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from FairShare import FairShare
+from JobQueue import JobQueue
+from Policies import get_policy
+from PortAllocator import PortAllocator
+from ContainerPool import ContainerPool
+from ResourceLedger import ResourceLedger
+from LoadSampler import LoadSampler
+from ContainerRegistry import ContainerRegistry
+from Database import Database
+from Metrics import SCHEDULING_LATENCY, START_LATENCY, DOCKER_ERRORS
 
 
 class Scheduler(Thread):
 
-    def __init__(self, maxJobs, unitCPU, unitMem, maxCPU, portUpper, portLower, strategy):
+    def __init__(self, maxJobs, unitCPU, unitMem, maxCPU, portUpper, portLower, strategy, wakeInterval=1.0, poolSize=0,
+                 poolPorts='', provisionWorkers=8, provisionTimeout=10.0, baseCPU=0, baseMem=0, loadInterval=1.0,
+                 loadSmoothing=0.3, registry=None, database=None, priorityWeights=None):
         """Variable initialisation for the class"""
         super(Scheduler, self).__init__()
         self.stopRequest = threading.Event()
+        self.wakeRequest = threading.Event()
+        self.wakeInterval = wakeInterval  # longest time to sleep without being notified
         self.strategy = strategy
+        self.policy = get_policy(strategy, priorityWeights)
 
         self.maxCPU = maxCPU  # per core
         self.unitCPU = unitCPU
         self.maxJobs = maxJobs
         self.unitMem = unitMem
 
-        self.dockr = docker.from_env()
-        self.db = None
-        self.db_cur = None
-        self.ports_lower = portLower
-        self.ports_upper = portUpper
+        # running containers are read from the registry, which also provides the Docker client
+        if registry is None:
+            registry = ContainerRegistry()
+            registry.start()
+        self.registry = registry
+        self.registry.subscribe(self.container_changed)
+        self.dockr = registry.dockr
+
+        # pool of database connections, shared with the request handler and monitor
+        self.database = Database() if database is None else database
+        self.fair_share = FairShare()
+        self.queue = JobQueue(self.fair_share)
+        self.ports = PortAllocator(portLower, portUpper)
+
+        # resources committed to the base service and the jobs, along with the measured load of the node
+        self.cores = psutil.cpu_count()
+        self.ledger = ResourceLedger(maxCPU * self.cores, psutil.virtual_memory().total / 1024 / 1024,
+                                     baseCPU, baseMem, unitCPU, unitMem)
+        self.load = LoadSampler(loadInterval, loadSmoothing)
+
+        # arguments used to create the containers of the jobs
+        self.container_args = {'image': "arek/alpine_ssh", 'cpu_period': self.maxCPU, 'tty': True,
+                               'cpu_quota': self.unitCPU, 'mem_limit': self.unitMem * 1024 * 1024,
+                               'network_mode': 'bridge'}
+
+        # pool of containers created ahead of time, if enabled
+        self.pool = None
+        if poolSize > 0:
+            self.pool = ContainerPool(self.dockr, self.ports, poolSize, poolPorts, self.get_capacity,
+                                      **self.container_args)
+
+        # claimed jobs are provisioned by a pool of workers, the IDs of the jobs being provisioned
+        # are kept so that they take up a slot until their container has been started
+        self.provisioners = ThreadPoolExecutor(max_workers=provisionWorkers)
+        self.provisionTimeout = provisionTimeout  # longest wait for each step of the exchange with a client
+        self.provisioning = set()
+        self.provisioningLock = threading.Lock()
 
         # SSL certificates
         self.server_cert = 'certs/server.crt'
         self.server_key = 'certs/server.key'
         self.client_cert = None
 
-    def send_msg(self, msg, conn):
-        """Sends a structured message containing the message length at the start
+    def notify(self):
+        """Wakes the scheduler up when a job is queued, a container is stopped or resources change"""
 
-        Parameters:
-            msg (str):  The message to be sent
-            conn (socket): HTTP socket connection
-
-        """
-
-        msg = struct.pack('>I', len(msg)) + msg.encode('ascii')
-        conn.sendall(msg)
+        self.wakeRequest.set()
 
     def check_resource(self):
-        """Checks if there are resources available for a next job
+        """Checks how many more jobs the available resources allow, both the resources not yet
+        committed and the average load of the node must have room for a job
 
         Returns:
-            bool: True/False whether resources available
+            int: Number of jobs the available CPU and RAM have room for
 
         """
 
-        # get amount of CPU and RAM available
-        availableCPU = 100 - psutil.cpu_percent()
-        availableMem = psutil.virtual_memory().available/1024/1024
+        # get average amount of CPU (as a percentage) and RAM available
+        availableCPU, availableMem = self.load.available()
+
+        # the percentage of the total CPU used by the CPU unit of a job
+        unitPercent = self.unitCPU / (self.maxCPU * self.cores) * 100
+
+        # the number of CPU and RAM units available limits the number of jobs
+        return int(min(availableCPU // unitPercent, availableMem // self.unitMem, self.ledger.available()))
 
-        # if available resources are at least equal to the CPU and RAM unit of a job return True
-        if availableCPU >= self.unitCPU / (self.maxCPU * psutil.cpu_count()) and availableMem >= self.unitMem:
-            return True
-        return False
+    def container_changed(self, action, info):
+        """Called by the registry whenever a container changes, waking the scheduler once one has exited
+
+        Parameters:
+            action (str): The Docker event action
+            info (ContainerInfo): The container record
+
+        """
+
+        if action in ('die', 'destroy', 'resync'):
+            self.notify()
 
     def stop_all_containers(self):
         """Stops all of the running containers when EFS is shutting down"""
 
-        while len(self.dockr.containers.list()) > 0:
-            container = self.dockr.containers.list()[0]
-            container.stop()
+        for c in self.registry.containers():
+            try:
+                self.dockr.api.stop(c.id)
+            except docker.errors.NotFound:
+                pass  # already gone
 
     def recv_key(self, conn):
         """Receives an SSH key
@@ -99,36 +155,32 @@ class Scheduler(Thread):
 
         return data
 
-    def notify_client(self, conn, job_id, ports):
+    def notify_client(self, conn, job_id, client, ports):
         """Notifies the client about the job being started
 
         Parameters:
             conn (socket): HTTP scoket connection
             job_id (int): The ID of the job which was started
+            client (str): Name of the client, whose chosen protocol version is used
             ports (dict): Dictionary of the port mappings
 
         """
 
         msg_dict = {'Msg': 'Started', 'JobID': job_id, 'Ports': ports}
-        self.send_msg(json.dumps(msg_dict), conn)
+        Protocol.send_msg(msg_dict, conn, Protocol.client_version(client))
 
     def get_ssh_key(self, conn):
-        """Receives and saves an SSH key
+        """Receives an SSH key, the key is kept in memory so jobs can be provisioned in parallel
 
         Parameters:
             conn (socket): HTTP scoket connection
 
-        """
-
-        # open file for writing
-        key_file = open('id_rsa.pub', 'wb')
+        Returns:
+            bytes: The SSH public key
 
-        # receive key
-        key = self.recv_key(conn)
+        """
 
-        # write key to file and close
-        key_file.write(key)
-        key_file.close()
+        return self.recv_key(conn)
 
     def get_queue_size(self):
         """Gets the size of the job queue
@@ -138,375 +190,404 @@ class Scheduler(Thread):
 
         """
 
-        self.db_cur.execute("SELECT COUNT(*) FROM job_queue")
-        size = self.db_cur.fetchone()[0]
-        return int(size)
+        return len(self.queue)
 
-    def get_next_client(self, priority=False):
-        """ Selects the next client whose job should be scheduled
+    def job_queued(self, job):
+        """Called when a job has been added to the job_queue table
 
         Parameters:
-            priority (bool): Boolean whether  priority needs to be considered
-                (default is False)
-
-        Returns:
-            str: The client name
-            (optional) int: The priority
+            job (list): The job_queue record of the job
 
         """
 
-        client_freq = {}
-        next_priority = 3
+        self.queue.add(job)
+        self.notify()
 
-        # if priority needs to be considered then get the next priority to schedule
-        # retrieve a list of waiting client
-        if priority:
-            next_priority = self.get_next_priority()
-            self.db_cur.execute("SELECT cust_name from job_queue WHERE priority=?", (next_priority,))
-        else:
-            self.db_cur.execute("SELECT cust_name from job_queue")
+    def job_removed(self, job_id):
+        """Called when a job has been deleted from the job_queue table before being started
 
-        waiting_clients = set([result[0] for result in self.db_cur.fetchall()])
+        Parameters:
+            job_id (int): The ID of the job
 
-        # for each waiting client get the previously run jobs frequency
-        for c in waiting_clients:
-            if priority:
-                self.db_cur.execute("SELECT COUNT(*) FROM jobs WHERE timestamp>=date('now','-7 day') AND cust_name=? "
-                                    "AND priority=?", (c, next_priority))
-            else:
-                self.db_cur.execute("SELECT COUNT(*) FROM jobs WHERE timestamp>=date('now','-7 day') AND cust_name=?",
-                                    (c,))
-            count = self.db_cur.fetchone()[0]
-            client_freq[c] = count
+        """
 
-        # returns the next client whose job needs scheduled
-        # if priority to be considered als returns the priority
-        if priority:
-            return min(client_freq, key=client_freq.get), next_priority
-        else:
-            return min(client_freq, key=client_freq.get)
+        self.queue.remove(job_id)
 
-    def get_next_priority(self):
-        """Selects the next job priority to be scheduled
+    def claim_jobs(self, num):
+        """Claims up to the specified number of jobs, moving them to the jobs history table
+        in a single transaction
+
+        Parameters:
+            num (int): The maximum number of jobs to claim
 
         Returns:
-            int: The job priority
+            list: The claimed jobs, in the order they were selected
 
         """
 
-        priority_weighted = {3: 0.5, 2: 0.35, 1: 0.15}
-        priority_freq = {}
+        jobs = []
+        claimed = []
 
-        #  get total number of previously run jobs
-        self.db_cur.execute("SELECT COUNT(*) FROM jobs WHERE timestamp>=date('now','-7 day')")
-        total_freq = self.db_cur.fetchone()[0]
+        # select the jobs using the configured policy, each job is counted straight away
+        # so that the next selection takes it into account
+        with self.queue.lock:
+            while len(jobs) < num and len(self.queue) > 0:
+                start = time.perf_counter()
+                job = self.policy.select(self.queue, self.fair_share)
+                jobs.append(self.queue.take(job[0]))
+                SCHEDULING_LATENCY.observe(time.perf_counter() - start)
 
-        # grab all waiting priorities
-        self.db_cur.execute("SELECT priority from job_queue")
-        waiting_priorities = set([result[0] for result in self.db_cur.fetchall()])
+        if len(jobs) == 0:
+            return claimed
 
-        # calculate frequency of job execution per each waiting priority
-        for p in waiting_priorities:
-            self.db_cur.execute("SELECT COUNT(*) FROM jobs WHERE timestamp>=date('now','-7 day') AND priority=?", (p,))
-            count = self.db_cur.fetchone()[0]
+        # the jobs count as being provisioned from before they leave the job queue table,
+        # so a termination arriving in the meantime waits for their containers
+        with self.provisioningLock:
+            self.provisioning.update(str(job[0]) for job in jobs)
 
-            if count > 0 and total_freq > 0:
-                priority_freq[p] = count/total_freq
+        try:
+            # move job records to jobs history table
+            moved = self.database.claim_jobs([job[0] for job in jobs]).result()
+        except sqlite3.Error as e:
+            # nothing was claimed, the jobs stay queued for the next attempt
+            print("Unable to claim jobs: {}".format(e))
+            with self.provisioningLock:
+                self.provisioning.difference_update(str(job[0]) for job in jobs)
+            for job in jobs:
+                self.queue.untake(job)
+            return []
+
+        for job in jobs:
+            if job[0] in moved:
+                claimed.append(job)
             else:
-                priority_freq[p] = 0.0
-
-        # sort waiting priorities from highest to lowest
-        ordered = sorted(waiting_priorities, reverse=True)
+                # job was removed from the queue in the meantime
+                with self.provisioningLock:
+                    self.provisioning.discard(str(job[0]))
+                self.queue.untake(job, requeue=False)
 
-        return self.select_priority(ordered, priority_freq, priority_weighted)
+        return claimed
 
-    def select_priority(self, waiting, priority_freq, priority_weighted, index=0):
-        """ Selects the next job priority to be scheduled from the waiting list
-        based on the priority weightings
+    def setup_ssh(self, container, key):
+        """Sets up passwordless access to the specified container
 
         Parameters:
-            waiting (list): List of priorities in the job queue
-            priority_freq (dict): Dictionary of priority frequencies
-            priority_weighted (dict): Dictionary of priority weightings
-            index (int): The index value at which to start looking through the waiting list
-                (default is 0)
-
-        Returns:
-            int: The job priority
+             container (Container): ID of the container to set up access for
+             key (bytes): The SSH public key of the client
 
         """
 
-        if priority_freq[waiting[index]] < priority_weighted[waiting[index]]:
-            return waiting[index]  # if priority under threshold then return it
-        elif index == len(waiting) - 1:
-            return waiting[0]  # get highest priority in the case all are over their threshold
-        else:
-            return self.select_priority(waiting, priority_freq, priority_weighted, index + 1)
+        # build a tarball in memory holding the .ssh folder and the authorized_keys file,
+        # with the ownership and modes required by sshd so no commands need to be run in the container
+        data = io.BytesIO()
+        with tarfile.open(fileobj=data, mode='w') as t:
+            folder = tarfile.TarInfo('.ssh')
+            folder.type = tarfile.DIRTYPE
+            folder.mode = 0o700
+            folder.mtime = time.time()
+            t.addfile(folder)
+
+            keys = tarfile.TarInfo('.ssh/authorized_keys')
+            keys.size = len(key)
+            keys.mode = 0o600
+            keys.mtime = folder.mtime
+            t.addfile(keys, io.BytesIO(key))
+
+        # extract it into the home folder of root in the container
+        container.put_archive('/root', data.getvalue())
+        print('ssh setup')
 
-    def get_next_job(self):
-        """Selects the next job based on the time of request
+    def map_ports(self, job_id, ports):
+        """Given a list of ports maps them to available ports on edge node
+
+        Parameters:
+            job_id (int): The job ID the ports are reserved for
+            ports (str): List of required ports separated by commas
 
         Returns:
-            list: The next job to run
+            dict/None: A dictionary of mapped ports or None if there are not enough free ports
 
         """
 
-        # gets oldest job first
-        self.db_cur.execute("SELECT * FROM job_queue ORDER BY datetime(timestamp) ASC LIMIT 1")
-        job = self.db_cur.fetchone()
-        job_id = job[0]
-
-        # move job record to jobs history table
-        self.db_cur.execute("INSERT INTO jobs SELECT * FROM job_queue WHERE id=?", (job_id,))
-        self.db_cur.execute("DELETE FROM job_queue WHERE id=?", (job_id,))
-        self.db.commit()
-        return job
-
-    def get_next_job_clients(self):
-        """Selects the next job based on client frequency
-
-        Returns:
-            list: The next job to run
+        mapped_ports = {}
 
-        """
+        # create list of required ports from the ports string
+        req_ports = ports.split(',')
+        req_ports.append('22')  # to allow ssh access
 
-        # get the next client whose job to schedule
-        next_client = self.get_next_client()
+        # get free ports
+        free_ports = self.ports.allocate(str(job_id), len(req_ports))
+        if free_ports is None:
+            return None
 
-        # get oldest job entry for the client
-        self.db_cur.execute("SELECT * FROM job_queue WHERE cust_name=? ORDER BY datetime(timestamp) ASC LIMIT 1",
-                            (next_client, ))
-        job = self.db_cur.fetchone()
-        job_id = job[0]
+        # map required ports to free ports
+        for i in range(len(req_ports)):
+            mapped_ports[req_ports[i]] = free_ports[i]
 
-        # move job record to jobs history table
-        self.db_cur.execute("INSERT INTO jobs SELECT * FROM job_queue WHERE id=?", (job_id,))
-        self.db_cur.execute("DELETE FROM job_queue WHERE id=?", (job_id,))
-        self.db.commit()
-        return job
+        return mapped_ports
 
-    def get_next_job_priority(self):
-        """Selects the next job based on job priority
+    def job_finished(self, job_id):
+        """Called once the container of a job has been stopped, releasing its resources
 
-        Returns:
-            list: The next job to run
+        Parameters:
+            job_id (int): The ID of the job
 
         """
 
-        # get next job priority to schedule
-        next_priority = self.get_next_priority()
+        self.ports.release(str(job_id))
+        self.ledger.release(str(job_id))
+        self.notify()
 
-        # gets oldest job entry with specified priority
-        self.db_cur.execute("SELECT * FROM job_queue WHERE priority=? ORDER BY datetime(timestamp) ASC LIMIT 1",
-                            (next_priority,))
-        job = self.db_cur.fetchone()
-        job_id = job[0]
-
-        # move job record to jobs history table
-        self.db_cur.execute("INSERT INTO jobs SELECT * FROM job_queue WHERE id=?", (job_id,))
-        self.db_cur.execute("DELETE FROM job_queue WHERE id=?", (job_id,))
-        self.db.commit()
-        return job
+    def start_container(self, job_id, ports):
+        """Used to start a container with the correct ID and port mapping
 
-    def get_next_job_priority_client(self):
-        """Selects the next job based on job priority and client frequency
+        Parameters:
+            job_id (int): The job ID to use as the container ID
+            ports (dict): Dictionary of the mapped ports
 
         Returns:
-            list: The next job to run
-
+            Container/None: If successful a Docker container else None
         """
 
-        # get the next priority and client whose job to schedule next
-        next_client, next_priority = self.get_next_client(priority=True)
-
-        # gets oldest job entry for specified client and priority
-        self.db_cur.execute("SELECT * FROM job_queue WHERE cust_name=? AND priority=? ORDER BY datetime(timestamp) "
-                            "ASC LIMIT 1", (next_client, next_priority))
-        job = self.db_cur.fetchone()
-        job_id = job[0]
-
-        # move job record to jobs history table
-        self.db_cur.execute("INSERT INTO jobs SELECT * FROM job_queue WHERE id=?", (job_id,))
-        self.db_cur.execute("DELETE FROM job_queue WHERE id=?", (job_id,))
-        self.db.commit()
-        return job
+        try:
+            return self.dockr.containers.run(detach=True, name=str(job_id), ports=ports, **self.container_args)
+        except docker.errors.APIError:
+            DOCKER_ERRORS.inc('scheduler')
+            return None
 
-    def setup_ssh(self, container):
-        """Sets up passwordless access to the specified container
+    def get_capacity(self):
+        """Gets the number of containers which can still be started within the job limit,
+        pooled containers count against the limit
 
-        Parameters:
-             container (Container): ID of the container to set up access for
+        Returns:
+            int: Number of containers
 
         """
 
-        # create tarball with ssh public key
-        with TarFile(name='key.tar', mode='w') as t:
-            t.add('id_rsa.pub')
-
-        # read in tar file as binary
-        tar = open('key.tar', mode='rb')
-        data = tar.read()
-
-        # put public key into temp folder of container
-        container.put_archive('/tmp', data)
-        container.exec_run('mkdir -p /root/.ssh/')
-        container.exec_run('scp /tmp/id_rsa.pub /root/.ssh/authorized_keys')
-        print('ssh setup')
-
-    def get_free_ports(self, num):
-        """Finds the required number of free ports
+        names = self.get_busy(self.registry.containers())
+        if self.pool is not None:
+            names.update(self.pool.names)  # pooled containers still being created
+        return self.maxJobs - len(names)
 
-        Parameters:
-            num (int): Number of required free ports
+    def get_running_jobs(self):
+        """Gets the number of job containers running
 
         Returns:
-            list: A list of free  ports
+            int: Number of containers
 
         """
 
-        ports = []
-
-        # get list of used ports
-        used_ports = self.get_used_ports()
-        while len(ports) < num:
-            # generate random port
-            port = random.randint(self.ports_lower, self.ports_upper)
-            #  if port not being used then append to free ports list
-            if port not in used_ports:
-                ports.append(port)
+        return sum(1 for c in self.registry.containers() if c.name.isdigit())
 
-        return ports
-
-    def get_used_ports(self):
-        """Gathers the ports currently being used by the running containers
+    def get_client_shares(self):
+        """Gets the share of the jobs run within the fairness window by each client
 
         Returns:
-              list: A list of used ports
+            dict: The share of the jobs keyed by client name
 
         """
 
-        # get list of all running containers
-        containers = self.dockr.containers.list()
-        client = docker.APIClient(base_url='unix://var/run/docker.sock')
+        with self.queue.lock:
+            return self.fair_share.client_shares()
 
-        used_ports = []
-        for c in containers:
+    def get_priority_shares(self):
+        """Gets the share of the jobs run within the fairness window with each priority
+
+        Returns:
+            dict: The share of the jobs keyed by priority
 
-            # gather the used ports by each of the containers
-            ports = client.inspect_container(c.id)['HostConfig']['PortBindings']
-            for port in ports:
-                used_ports.append(ports[port][0]['HostPort'])
+        """
 
-        return used_ports
+        with self.queue.lock:
+            return self.fair_share.priority_shares()
 
-    def map_ports(self, ports):
-        """Given a list of ports maps them to available ports on edge node
+    def get_busy(self, containers, pooled=True):
+        """Gets the names of the containers taking up a slot, including jobs still being provisioned
 
         Parameters:
-            ports (str): List of required ports separated by commas
+            containers (list): The running containers
+            pooled (bool): Whether to include the pooled containers
+                (default is True)
 
         Returns:
-            dict: A dictionary of mapped ports
+            set: The container names
 
         """
 
-        mapped_ports = {}
+        names = set(c.name for c in containers if pooled or not c.name.startswith(ContainerPool.PREFIX))
+        with self.provisioningLock:
+            return names | self.provisioning
 
-        # create list of required ports from the ports string
-        req_ports = ports.split(',')
-        req_ports.append('22')  # to allow ssh access
+    def is_provisioning(self, job_id):
+        """Checks whether the container of a job is still being started
 
-        # get free ports
-        free_ports = self.get_free_ports(len(req_ports))
+        Parameters:
+            job_id (int): The ID of the job
 
-        # map required ports to free ports
-        for i in range(len(req_ports)):
-            mapped_ports[req_ports[i]] = free_ports[i]
+        Returns:
+            bool: True/False whether the job is being provisioned
 
-        return mapped_ports
+        """
 
-    def start_container(self, job_id, ports):
-        """Used to start a container with the correct ID and port mapping
+        with self.provisioningLock:
+            return str(job_id) in self.provisioning
+
+    def start_job(self, job):
+        """Called by the main function to hand a claimed job over to the provisioning workers
 
         Parameters:
-            job_id (int): The job ID to use as the container ID
-            ports (dict): Dictionary of the mapped ports
+            job (list): The claimed job to start
 
-        Returns:
-            Container/None: If successful a Docker container else None
         """
 
-        try:
-            return self.dockr.containers.run("arek/alpine_ssh", cpu_period=self.maxCPU, tty=True, cpu_quota=self.unitCPU,
-                                             mem_limit=self.unitMem * 1024 * 1024, detach=True, name=str(job_id),
-                                             network_mode='bridge', ports=ports)
-        except docker.errors.APIError:
-            return None
-
-    def start_job(self):
-        """Called by the main function to start a new job"""
+        # the job was marked as being provisioned when it was claimed
+        self.ledger.reserve(str(job[0]))
 
-        # call appropriate method based on what's specified in config
-        if self.strategy == 0:
-            job = self.get_next_job()
-        elif self.strategy == 1:
-            job = self.get_next_job_clients()
-        elif self.strategy == 2:
-            job = self.get_next_job_priority()
-        else:
-            job = self.get_next_job_priority_client()
+        self.provisioners.submit(self.provision_job, job, time.perf_counter())
 
-        # get dictionary of mapped ports
-        ports_dict = self.map_ports(job[6])
+    def provision_job(self, job, dispatched):
+        """Called by a provisioning worker to start the container of a job and hand it over to the client,
+        if any step fails the container is removed and its slot and ports are released
 
-        # set up secure communication with client using SSL
-        context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile='certs/'+job[1]+'.crt')
-        context.load_cert_chain(certfile=self.server_cert, keyfile=self.server_key)
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        conn = context.wrap_socket(s, server_side=False, server_hostname=job[1])
-        conn.connect((job[2], job[3]))
+        Parameters:
+            job (list): The claimed job to start
+            dispatched (float): The time the job was handed over to the workers
 
-        print("Start container {}".format(job[0]))
+        """
 
-        # start container
+        conn = None
+        container = None
+        started = False
         try:
-            container = self.start_container(job[0], ports_dict)
-        except docker.errors.APIError:
-            self.dockr = docker.from_env()
-            container = self.start_container(job[0], ports_dict)
-
-        if container is None:
-            # sometimes a port conflict error occurs
-            ports_dict = self.map_ports(job[6])
-            container = self.start_container(job[0], ports_dict)
-
-        # if container started successfully notify client and set up SSH
-        if container is not None:
+            # set up secure communication with client using SSL, each step waits at most provisionTimeout
+            context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile='certs/'+job[1]+'.crt')
+            context.load_cert_chain(certfile=self.server_cert, keyfile=self.server_key)
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.settimeout(self.provisionTimeout)
+            conn = context.wrap_socket(s, server_side=False, server_hostname=job[1])
+            conn.connect((job[2], job[3]))
+
+            # use a pooled container if one maps the required ports
+            if self.pool is not None:
+                claimed = self.pool.claim(job[0], job[6])
+                if claimed is not None:
+                    container, ports_dict = claimed
+
+            if container is None:
+                # otherwise get dictionary of mapped ports for a new container
+                ports_dict = self.map_ports(job[0], job[6])
+                if ports_dict is None:
+                    print("Unable to start the job {}, no free ports".format(job[0]))
+                    return
+
+                # make room for the container by giving up a pooled one if the job limit has been reached
+                if self.pool is not None and self.get_capacity() < 0:
+                    self.pool.evict()
+
+                print("Start container {}".format(job[0]))
+                container = self.start_container(job[0], ports_dict)
+                if container is None:
+                    print("Unable to start the job {}".format(job[0]))
+                    return
+
+            # notify client and set up SSH
             print('about to notify {}:{}'.format(job[2], job[3]))
-            self.notify_client(conn, job[0], ports_dict)
-            self.get_ssh_key(conn)
-            self.setup_ssh(container)
-        else:
-            print("Unable to start the job")
+            self.notify_client(conn, job[0], job[1], ports_dict)
+            key = self.get_ssh_key(conn)
+            self.setup_ssh(container, key)
+
+            # record the container straight away so its slot is kept once provisioning is over
+            self.registry.track(container.id)
+            started = True
+            START_LATENCY.observe(time.perf_counter() - dispatched)
+        except docker.errors.APIError as e:
+            DOCKER_ERRORS.inc('scheduler')
+            print("Unable to start the job {}: {}".format(job[0], e))
+        except OSError as e:
+            print("Unable to start the job {}: {}".format(job[0], e))
+        finally:
+            if conn is not None:
+                conn.close()
+
+            # a job which failed to start gives up its container, ports and slot
+            if not started and container is not None:
+                try:
+                    container.remove(force=True)
+                except docker.errors.APIError:
+                    pass  # already gone
+            with self.provisioningLock:
+                self.provisioning.discard(str(job[0]))
+            if not started:
+                self.job_finished(job[0])
 
     def run(self):
         """Main function responsible for the scheduling of jobs"""
 
-        # initialise database connection
-        self.db = sqlite3.connect('edge.db')
-        self.db_cur = self.db.cursor()
+        # build the fair share index from the jobs history and load the queued jobs
+        with self.database.cursor() as cur, self.queue.lock:
+            self.fair_share.rebuild(cur)
+            self.queue.load(cur)
+
+        # take account of the ports used by containers which are already running
+        self.registry.ready.wait()
+        containers = self.registry.containers()
+        self.ports.reconcile(containers)
+        for c in containers:
+            if c.name.isdigit():
+                self.ledger.reserve(c.name)
+        self.load.start()
+        self.load.ready.wait()
+
+        # start filling the pool, leftover pooled containers are of no use as their port mappings are unknown
+        if self.pool is not None:
+            for c in containers:
+                if c.name.startswith(ContainerPool.PREFIX):
+                    try:
+                        self.dockr.api.remove_container(c.id, force=True)
+                    except docker.errors.NotFound:
+                        pass  # already gone
+                    self.pool.discard(c.name, None)
+            self.pool.start()
 
         print('Scheduler Initialised')
 
         while not self.stopRequest.is_set():
-            currentJobs = len(self.dockr.containers.list())
-            if self.get_queue_size() > 0 and currentJobs < self.maxJobs:  # check if more jobs allowed
-                if self.check_resource():  # check if resources available
-                    self.start_job()
+            # sleep until notified, the timeout ensures changes in resource usage are still picked up
+            self.wakeRequest.wait(self.wakeInterval)
+            self.wakeRequest.clear()
+
+            # start jobs for as long as the queue, job limit and resources allow
+            while not self.stopRequest.is_set():
+                # release the ports of any containers which have exited by themselves,
+                # keeping those of the jobs being provisioned and the pooled containers being created
+                containers = self.registry.containers()
+                names = self.get_busy(containers)
+                self.ledger.retain(names)
+                if self.pool is not None:
+                    names.update(self.pool.names)
+                self.ports.retain(names)
+
+                # fill every slot allowed by both the job limit and the available resources,
+                # pooled containers are left out as jobs can claim them
+                busy = self.get_busy(containers, pooled=False)
+                slots = min(self.maxJobs - len(busy), self.check_resource())
+                if slots <= 0:
+                    break
+
+                jobs = self.claim_jobs(slots)
+                if len(jobs) == 0:
+                    break
+                for job in jobs:
+                    self.start_job(job)
 
     def join(self, timeout=None):
         """Called when the EFS is being shut down, stopping the Thread safely"""
         self.stopRequest.set()
+        self.wakeRequest.set()
+        self.provisioners.shutdown(wait=True)
+        self.load.join()
+        if self.pool is not None:
+            self.pool.join()
         self.stop_all_containers()
 
         # delete all unused containers
@@ -0,0 +1,381 @@
+""" The Simulator for Edge Fair Scheduler
+
+This script replays a trace of job arrivals through the scheduling
+policies, job queue and fair share index of EFS on a virtual clock,
+so a week of traffic is simulated in seconds rather than days. The
+node is modelled from the same settings as config.ini: the number of
+jobs it can run follows from the CPU and RAM units, jobs run slower
+the smaller their CPU unit, and jobs which have gone idle are killed
+once they have been idle for the idle period, as the Monitor does.
+Several configurations can be swept in parallel across the cores.
+
+The trace is a JSON Lines file, one job per line:
+    {"time": 0, "client": "arek", "priority": 3, "work": 600, "terminate": 1800}
+where time is the arrival in seconds from the start of the trace (or
+a 'YYYY-MM-DD HH:MM:SS' timestamp), work is the CPU time the job
+needs in seconds on a whole core, and the optional terminate is the
+number of seconds after starting at which the client ends the job.
+
+Usage:
+    python Simulator.py trace.jsonl [--sweep strategy=fcfs,hybrid] [--output results.json]
+    python Simulator.py --generate trace.jsonl --days 7
+"""
+
+import argparse
+import configparser
+import datetime
+import heapq
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import sys
+from FairShare import FairShare
+from JobQueue import JobQueue
+from Policies import PRIORITY_WEIGHTED, get_policy, load_policies, parse_weights
+
+# timestamp format used by the job queue
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# settings of the simulated node, with the same names as in config.ini, and their defaults
+SETTINGS = {'strategy': 'hybrid', 'maxcpu': 100000, 'basecpu': 100000, 'cpuunit': 50000, 'basemem': 256,
+            'memunit': 256, 'idleperiod': 2.0, 'sampleinterval': 10.0, 'priorityweights': '', 'policies': '',
+            'cores': 4, 'memory': 4096}
+
+
+class VirtualClock:
+    """The simulated time, used as the clock of the fair share index"""
+
+    def __init__(self, start):
+        self.start = start
+        self.time = 0.0
+
+    def now(self):
+        return self.start + datetime.timedelta(seconds=self.time)
+
+
+def read_trace(path):
+    """Reads a trace of job arrivals
+
+    Parameters:
+        path (str): Path of the JSON Lines trace
+
+    Returns:
+        tuple: The start time of the trace and the jobs sorted by arrival
+    """
+
+    jobs = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                jobs.append(json.loads(line))
+
+    # arrivals given as timestamps are turned into seconds from the first one
+    stamps = [j['time'] for j in jobs if isinstance(j['time'], str)]
+    start = min(datetime.datetime.strptime(s, TIME_FORMAT) for s in stamps) if stamps else \
+        datetime.datetime(2020, 1, 1)
+    for j in jobs:
+        if isinstance(j['time'], str):
+            j['time'] = (datetime.datetime.strptime(j['time'], TIME_FORMAT) - start).total_seconds()
+
+    jobs.sort(key=lambda j: j['time'])
+    return start, jobs
+
+
+def generate_trace(path, clients, days, rate, seed):
+    """Generates a trace of job arrivals with a daily cycle of load
+
+    Parameters:
+        path (str): Path to write the trace to
+        clients (int): Number of clients, the first few of which submit most of the jobs
+        days (float): Length of the trace in days
+        rate (float): Average number of arrivals per hour
+        seed (int): Seed of the random generator
+
+    """
+
+    rng = random.Random(seed)
+    names = ['client{}'.format(i) for i in range(clients)]
+    activity = [1.0 / (i + 1) for i in range(clients)]  # a few heavy clients and many light ones
+
+    def pick(values, weights):
+        r = rng.uniform(0, sum(weights))
+        for v, w in zip(values, weights):
+            r -= w
+            if r <= 0:
+                return v
+        return values[-1]
+
+    t = 0.0
+    with open(path, 'w') as f:
+        while t < days * 86400:
+            # arrivals peak during the day and drop off at night
+            hourly = rate * (1 + 0.8 * math.sin(2 * math.pi * (t % 86400) / 86400))
+            t += rng.expovariate(max(hourly, 0.01) / 3600)
+
+            job = {'time': round(t, 1), 'client': pick(names, activity),
+                   'priority': pick((1, 2, 3), (0.5, 0.3, 0.2)),
+                   'work': round(rng.lognormvariate(math.log(300), 1), 1)}
+            if rng.random() < 0.3:
+                job['terminate'] = round(job['work'] * rng.uniform(0.5, 3), 1)
+            f.write(json.dumps(job) + '\n')
+
+
+def max_jobs(settings):
+    """Calculates the number of jobs the node can run, as EFS does when reading its config
+
+    Parameters:
+        settings (dict): The node settings
+
+    Returns:
+        int: The maximum number of jobs
+    """
+
+    max_cpu = math.floor(((settings['maxcpu'] * settings['cores']) - settings['basecpu']) / settings['cpuunit'])
+    max_mem = math.floor((settings['memory'] - settings['basemem']) / settings['memunit'])
+    return max(min(max_cpu, max_mem), 0)
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Gets percentiles of a list of values
+
+    Parameters:
+        values (list): The values
+        points (tuple): The percentiles to get, between 0 and 100
+            (default is the 50th, 90th and 99th)
+
+    Returns:
+        dict: The values keyed by 'p' and the percentile
+    """
+
+    values = sorted(values)
+    if len(values) == 0:
+        return {'p{}'.format(p): None for p in points}
+    return {'p{}'.format(p): values[min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)]
+            for p in points}
+
+
+def jain(values):
+    """Calculates Jain's fairness index, 1 when all values are equal and 1/n at its most unfair
+
+    Parameters:
+        values (list): The allocations
+
+    Returns:
+        float/None: The index or None if there are no allocations
+    """
+
+    values = list(values)
+    squares = sum(v * v for v in values)
+    if len(values) == 0 or squares == 0:
+        return None
+    return sum(values) ** 2 / (len(values) * squares)
+
+
+def simulate(settings, start, trace):
+    """Simulates a trace of job arrivals with the given node settings
+
+    Parameters:
+        settings (dict): The node settings
+        start (datetime): The start time of the trace
+        trace (list): The jobs sorted by arrival
+
+    Returns:
+        dict: The results of the simulation
+    """
+
+    load_policies(settings['policies'])
+    clock = VirtualClock(start)
+    fair_share = FairShare(clock=clock.now)
+    queue = JobQueue(fair_share)
+    weights = parse_weights(settings['priorityweights']) or PRIORITY_WEIGHTED
+    policy = get_policy(settings['strategy'], weights)
+
+    slots = max_jobs(settings)
+    speed = min(settings['cpuunit'] / float(settings['maxcpu']), 1.0)  # share of a core each job gets
+    idle_kill = settings['idleperiod'] * 60 + settings['sampleinterval']  # time before an idle job is killed
+
+    # events are (time, sequence, kind, job index), arrivals before finishes at the same time
+    events = [(job['time'], i, 0, i) for i, job in enumerate(trace)]
+    heapq.heapify(events)
+    sequence = itertools.count(len(trace))
+
+    started = {}
+    contended = {}  # jobs started by each priority while others were left waiting
+    running = 0
+    busy = 0.0  # slot seconds spent running jobs
+    working = 0.0  # slot seconds spent by jobs which were not idle
+    end = 0.0
+
+    while events:
+        clock.time, _, kind, i = heapq.heappop(events)
+        end = clock.time
+
+        if kind == 0:
+            job = trace[i]
+            queue.add((i, job['client'], '127.0.0.1', 0, job['priority'], clock.now().strftime(TIME_FORMAT), ''))
+        else:
+            running -= 1
+
+        # start jobs for as long as there are free slots
+        while running < slots and len(queue) > 0:
+            selected = policy.select(queue, fair_share)
+            queue.take(selected[0])
+            job = trace[selected[0]]
+
+            # the job runs until it is terminated by the client or killed once idle
+            active = job['work'] / speed
+            lifetime = active + idle_kill
+            if job.get('terminate') is not None:
+                lifetime = min(lifetime, job['terminate'])
+
+            started[selected[0]] = clock.time
+            if len(queue) > 0:
+                contended[job['priority']] = contended.get(job['priority'], 0) + 1
+            busy += lifetime
+            working += min(active, lifetime)
+            running += 1
+            heapq.heappush(events, (clock.time + lifetime, next(sequence), 1, selected[0]))
+
+    # waits per client and priority
+    waits = [started[i] - trace[i]['time'] for i in started]
+    by_client = {}
+    by_priority = {}
+    for i in started:
+        by_client.setdefault(trace[i]['client'], []).append(started[i] - trace[i]['time'])
+        by_priority.setdefault(trace[i]['priority'], []).append(started[i] - trace[i]['time'])
+
+    # share of the contended starts each priority was given relative to its target share
+    total = float(sum(contended.values()))
+    priority_share = {p: n / total for p, n in contended.items()} if total > 0 else {}
+
+    capacity = slots * end
+    return {
+        'settings': settings,
+        'max_jobs': slots,
+        'jobs': len(trace),
+        'started': len(started),
+        'simulated_days': end / 86400,
+        'wait': percentiles(waits),
+        'wait_by_priority': {str(p): percentiles(w) for p, w in sorted(by_priority.items())},
+        'jain_client_wait': jain(sum(w) / len(w) for w in by_client.values()),
+        'jain_priority_share': jain(priority_share[p] / weights[p] for p in priority_share if weights.get(p)),
+        'priority_share': {str(p): s for p, s in sorted(priority_share.items())},
+        'utilization': busy / capacity if capacity > 0 else 0.0,
+        'useful_utilization': working / capacity if capacity > 0 else 0.0,
+    }
+
+
+def run(args):
+    """Runs a single simulation, used by the pool of worker processes
+
+    Parameters:
+        args (tuple): The node settings and the path of the trace
+
+    Returns:
+        dict: The results of the simulation
+    """
+
+    settings, path = args
+    start, trace = read_trace(path)
+    return simulate(settings, start, trace)
+
+
+def read_settings(path):
+    """Reads the node settings from a config file, using the defaults for any missing
+
+    Parameters:
+        path (str): Path of the config file or None
+
+    Returns:
+        dict: The node settings
+    """
+
+    settings = dict(SETTINGS)
+    if path:
+        parser = configparser.ConfigParser()
+        parser.read(path)
+        for key in settings:
+            if parser.has_option('SERVER', key):
+                settings[key] = type(SETTINGS[key])(parser.get('SERVER', key))
+    return settings
+
+
+def expand(settings, sweeps):
+    """Expands the sweeps into the settings of each simulation
+
+    Parameters:
+        settings (dict): The base node settings
+        sweeps (list): Sweeps given as 'name=value,value'
+
+    Returns:
+        list: The settings of each simulation
+    """
+
+    names = []
+    choices = []
+    for sweep in sweeps:
+        name, values = sweep.split('=', 1)
+        if name not in SETTINGS:
+            raise ValueError('Unknown setting {}'.format(name))
+        names.append(name)
+        # priority weights contain commas themselves so their alternatives are separated by semicolons
+        separator = ';' if name == 'priorityweights' else ','
+        choices.append([type(SETTINGS[name])(v) for v in values.split(separator) if v])
+
+    runs = []
+    for combination in itertools.product(*choices):
+        s = dict(settings)
+        s.update(zip(names, combination))
+        runs.append(s)
+    return runs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulates EFS scheduling strategies over a trace of job arrivals')
+    parser.add_argument('trace', help='JSON Lines trace of job arrivals')
+    parser.add_argument('--config', help='config.ini to take the node settings from')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='overrides a node setting, e.g. cores=8')
+    parser.add_argument('--sweep', action='append', default=[], metavar='NAME=VALUES',
+                        help='simulates each of the values of a setting, e.g. strategy=fcfs,hybrid')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default one per core)')
+    parser.add_argument('--output', default='simulation.json')
+    parser.add_argument('--generate', action='store_true', help='generate a trace instead of simulating one')
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--rate', type=float, default=15, help='average arrivals per hour')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        generate_trace(args.trace, args.clients, args.days, args.rate, args.seed)
+        print('Trace written to {}'.format(args.trace))
+        return 0
+
+    settings = read_settings(args.config)
+    for s in args.set:
+        name, value = s.split('=', 1)
+        settings[name] = type(SETTINGS[name])(value)
+    runs = expand(settings, args.sweep)
+
+    # simulations are independent so they are spread across the cores
+    with multiprocessing.Pool(args.processes) as pool:
+        results = pool.map(run, [(s, args.trace) for s in runs])
+
+    for r in results:
+        swept = ' '.join('{}={}'.format(s.split('=')[0], r['settings'][s.split('=')[0]]) for s in args.sweep)
+        print('{} wait p50 {:.0f}s p99 {:.0f}s, jain client wait {:.3f}, jain priority {:.3f}, '
+              'utilization {:.1%}'.format(swept or settings['strategy'], r['wait']['p50'] or 0, r['wait']['p99'] or 0,
+                                          r['jain_client_wait'] or 0, r['jain_priority_share'] or 0,
+                                          r['utilization']))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results written to {}'.format(args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
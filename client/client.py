@@ -1,9 +1,9 @@
 import socket
 import ssl
-import struct
-import json
-from threading import Thread
+from threading import Thread, Lock
+from concurrent.futures import Future, TimeoutError as ReplyTimeout
 import subprocess
+import Protocol  # copy Protocol.py from EFS alongside this script
 
 host_addr = '192.168.0.50'  # replace with edge node IP
 host_port = 6000  # replace with edge node port used for EFS
@@ -13,37 +13,30 @@ server_cert = 'certs/server.crt'  # replace with edge node certificate path
 client_cert = 'certs/arek.crt'  # replace with client certificate path
 client_key = 'certs/arek.key'  # replace with client key path
 ssh_path = '/root/.ssh/id_rsa.pub'  # replace with path to public ssh key
+timeout = 30  # seconds to wait for EFS when connecting and for each reply
 
+# TLS sessions can only be resumed from Python 3.6
+TLS_RESUMPTION = hasattr(ssl.SSLSocket, 'session')
 
-def recv_message(sock):
-    # First acquire the message length
-    msg_len = recv_data(sock, 4)
-    if not msg_len:
-        return None
-    msg_len = struct.unpack('>I', msg_len)[0]
-    # Return the full message, undecoded
-    return recv_data(sock, msg_len)
 
-
-def recv_data(sock, msg_len):
-    # Read the message data
-    data = b''
-    while len(data) < msg_len:
-        packet = sock.recv(msg_len - len(data))
-        if not packet:
-            return None
-        data += packet
-    # Return undecoded message data
-    return data
+def handle_conn(conn):
+    message = Protocol.decode(Protocol.recv_message(conn))
+    handle_message(conn, message)
+    conn.close()
 
 
-def handle_conn(conn):
-    message = json.loads(str(recv_message(conn), 'utf-8'))
+def handle_message(conn, message):
     print(message)
 
     if message['Msg'] == 'Accepted':
         if message['RequestType'] == 'Start':
             print("Job accepted with ID {}".format(message['JobID']))
+        elif message['RequestType'] == 'Start Batch':
+            for job in message['Jobs']:
+                if job['Msg'] == 'Accepted':
+                    print("Job accepted with ID {}".format(job['JobID']))
+                else:
+                    print("Job refused because: {}".format(job['Reason']))
         else:
             print("Job termination accepted")
     elif message['Msg'] == 'Started':
@@ -62,7 +55,130 @@ def handle_conn(conn):
     elif message['Msg'] == 'Refused':
         print("Message refused because: {}".format(message['Reason']))
 
-    conn.close()
+
+class Session:
+    # keeps a single authenticated connection open to EFS over which any number of requests
+    # can be sent without waiting for the previous reply, replies are matched up by request ID
+
+    def __init__(self):
+        # the same context is needed for the TLS session to be resumed on reconnecting
+        self.context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=server_cert)
+        self.context.load_cert_chain(certfile=client_cert, keyfile=client_key)
+        self.tls_session = None
+        self.conn = None
+        self.lock = Lock()
+        self.pending = {}
+        self.next_id = 0
+        self.version = Protocol.JSON  # protocol version agreed with EFS for the session
+        self.timeout = timeout
+
+    def connect(self):
+        # resume the previous TLS session if there is one to avoid a full handshake, which needs Python 3.6
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.settimeout(self.timeout)
+        if TLS_RESUMPTION:
+            conn = self.context.wrap_socket(s, server_side=False, server_hostname=server_sni_hostname,
+                                            session=self.tls_session)
+        else:
+            conn = self.context.wrap_socket(s, server_side=False, server_hostname=server_sni_hostname)
+        conn.connect((host_addr, host_port))
+
+        # ask EFS to keep the connection open, offering the protocol versions this script supports
+        Protocol.send_msg({'Request': 'Open Session', 'Protocol': list(Protocol.VERSIONS)}, conn)
+        reply = Protocol.decode(Protocol.recv_message(conn))
+        if reply.get('Msg') != 'Accepted':
+            conn.close()
+            raise ConnectionError("Session refused: {}".format(reply.get('Reason')))
+
+        self.version = reply.get('Protocol', Protocol.JSON)
+        if TLS_RESUMPTION:
+            self.tls_session = conn.session
+        self.conn = conn
+
+        # an idle session waits for replies without a limit, each request is timed out on its own
+        conn.settimeout(None)
+        Thread(target=self.receive_replies, args=(conn,), daemon=True).start()
+
+    def receive_replies(self, conn):
+        # hand each reply to the request waiting for it
+        while True:
+            try:
+                data = Protocol.recv_message(conn)
+            except (OSError, ssl.SSLError):
+                data = None
+            if data is None:
+                break
+
+            reply = Protocol.decode(data)
+            with self.lock:
+                future = self.pending.pop(reply.get('RequestID'), None)
+            if future is not None:
+                future.set_result(reply)
+
+        # fail any requests which will not get a reply
+        conn.close()
+        with self.lock:
+            if self.conn is conn:
+                self.conn = None
+            pending = [f for i, f in list(self.pending.items()) if f.conn is conn]
+            for future in pending:
+                self.pending.pop(future.request_id)
+        for future in pending:
+            future.set_exception(ConnectionError("Session closed before a reply was received"))
+
+    def request(self, msg):
+        # sends a request and returns a future for its reply, reconnecting if the session was closed
+        with self.lock:
+            self.next_id += 1
+            msg = dict(msg, RequestID=self.next_id)
+            future = Future()
+            future.request_id = self.next_id
+
+            # if the connection was dropped then reconnect and try once more
+            for attempt in range(2):
+                try:
+                    if self.conn is None:
+                        self.connect()
+                    future.conn = self.conn
+                    self.pending[self.next_id] = future
+                    Protocol.send_msg(msg, self.conn, self.version)
+                    break
+                except (OSError, ssl.SSLError) as e:
+                    self.pending.pop(self.next_id, None)
+                    if self.conn is not None:
+                        self.conn.close()
+                        self.conn = None
+                    if attempt == 1:
+                        future.set_exception(e)
+        return future
+
+    def wait(self, future):
+        # waits for the reply to a request, giving up on it after the session timeout
+        try:
+            return future.result(timeout=self.timeout)
+        except ReplyTimeout:
+            with self.lock:
+                self.pending.pop(future.request_id, None)
+            raise ReplyTimeout("No reply from EFS within {} seconds".format(self.timeout))
+
+    def new_job(self, priority, ports):
+        job = {'ID': 'None', 'Priority': priority, 'Ports': ports, 'CommsPort': listening_port}
+        return self.request({'Request': 'New Job', 'Job': job})
+
+    def new_jobs(self, jobs):
+        # jobs is a list of (priority, ports) pairs, all of which are sent in a single request
+        jobs = [{'ID': 'None', 'Priority': p, 'Ports': ports, 'CommsPort': listening_port} for p, ports in jobs]
+        return self.request({'Request': 'New Jobs', 'Jobs': jobs})
+
+    def terminate_job(self, jobid):
+        return self.request({'Request': 'Terminate', 'JobID': jobid})
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                Protocol.send_msg({'Request': 'Close Session'}, self.conn, self.version)
+                self.conn.close()
+                self.conn = None
 
 
 def eternal_listener():
@@ -100,12 +216,10 @@ def new_job(priority, ports):
 
     # form job request
     job = {'ID': 'None', 'Priority': priority, 'Ports': ports, 'CommsPort': listening_port}
-    msg = {'Request': 'New Job', 'Job': job}
+    msg = {'Request': 'New Job', 'Job': job, 'Protocol': list(Protocol.VERSIONS)}
 
     # send request
-    msg = json.dumps(msg)
-    msg = struct.pack('>I', len(msg)) + msg.encode('ascii')
-    conn.sendall(msg)
+    Protocol.send_msg(msg, conn)
 
     handle_conn(conn)
 
@@ -121,38 +235,50 @@ def terminate_job(jobid):
     conn.connect((host_addr, host_port))
 
     # form and send termination request
-    msg = {'Request': 'Terminate', 'JobID': jobid}
-    msg = json.dumps(msg)
-    msg = struct.pack('>I', len(msg)) + msg.encode('ascii')
-    conn.sendall(msg)
+    msg = {'Request': 'Terminate', 'JobID': jobid, 'Protocol': list(Protocol.VERSIONS)}
+    Protocol.send_msg(msg, conn)
 
     handle_conn(conn)
 
 
 def start():
+    session = Session()
+
     # runs continuously until user enters exit
     while True:
         try:
             print("Enter \"New Job\" for a new job request\n"
+                  "Enter \"New Jobs\" for a request for several jobs\n"
                   "Enter \"Terminate\" for a termination request\n"
                   "Or \"Exit\" to quit")
             option = input("What would you liked to do? Select from the available options above: ")
             if option.lower() == "new job":
                 priority = int(input("Job Priority?"))
                 ports = str(input("Enter required ports as list separated by commas (No Spaces)"))
-                new_job(priority, ports)
+                handle_message(None, session.wait(session.new_job(priority, ports)))
                 print("Start New Job")
+            elif option.lower() == "new jobs":
+                count = int(input("Number of jobs?"))
+                priority = int(input("Job Priority?"))
+                ports = str(input("Enter required ports as list separated by commas (No Spaces)"))
+                handle_message(None, session.wait(session.new_jobs([(priority, ports)] * count)))
+                print("Start New Jobs")
             elif option.lower() == "terminate":
                 jid = int(input("JobId?"))
-                terminate_job(jid)
+                handle_message(None, session.wait(session.terminate_job(jid)))
                 print("Terminate Job")
             elif option.lower() == "exit":
+                session.close()
                 print("Bye Bye!")
                 exit(0)
             else:
                 print("INVALID OPTION SELECTED! TRY AGAIN!")
             subprocess.call('clear', shell=True)
+        except (ReplyTimeout, OSError) as e:
+            # the request is given up on, the session reconnects for the next one if it was dropped
+            print("Request failed: {}".format(e))
         except KeyboardInterrupt:
+            session.close()
             print("Bye Bye!")
             break
 
@@ -8,10 +8,10 @@ sudo add-apt-repository "deb [arch=amd64] https://download.docker.com/linux/ubun
 ## Install libraries and packages
 sudo apt-get update -y
 sudo apt-get install -y docker-ce openssl sqlite3 python3.5 python3-pip
-pip3 install docker psutil
+pip3 install docker psutil msgpack
 
 ## Create EFS directory and copy file
 mkdir -p /root/EFS/certs
-cp EFS.py Monitor.py Scheduler.py config.ini /root/EFS/
+cp EFS.py Monitor.py Scheduler.py FairShare.py JobQueue.py Migrations.py Policies.py PortAllocator.py ContainerPool.py CgroupStats.py IdleSampler.py ResourceLedger.py LoadSampler.py ContainerRegistry.py Metrics.py Database.py HistoryCompactor.py Admission.py Protocol.py config.ini /root/EFS/
 
 docker build Docker/ -t arek/alpine_ssh
\ No newline at end of file
@@ -0,0 +1,162 @@
+""" Differential tests for the scheduling policies
+
+Replays random job queues and jobs histories through the SQL job
+selection the Scheduler used before the policies were moved in memory,
+counting the history with the original queries over the jobs table,
+and through the registered policies over the JobQueue and a FairShare
+index rebuilt from the same table. Every strategy must pick the same
+jobs in the same order. The original selection left ties between
+clients to the order of a Python set and ties between timestamps to
+SQLite, so where jobs are tied any of them is accepted and the
+reference carries on from the job the policy chose.
+"""
+
+import datetime
+import random
+import sqlite3
+
+import pytest
+
+from FairShare import FairShare
+from JobQueue import JobQueue
+from Migrations import migrate
+from Policies import PRIORITY_WEIGHTED, get_policy
+
+QUEUES = 40
+
+
+class SqlSelection:
+    """The job selection of the Scheduler as it was written in SQL"""
+
+    def __init__(self, cur, strategy):
+        self.cur = cur
+        self.strategy = strategy
+
+    def get_next_clients(self, priority=False):
+        """Gets the clients the original selection could have chosen, all of which have run the fewest jobs"""
+
+        client_freq = {}
+        next_priority = 3
+
+        if priority:
+            next_priority = self.get_next_priority()
+            self.cur.execute("SELECT cust_name from job_queue WHERE priority=?", (next_priority,))
+        else:
+            self.cur.execute("SELECT cust_name from job_queue")
+
+        waiting_clients = set([result[0] for result in self.cur.fetchall()])
+
+        for c in waiting_clients:
+            if priority:
+                self.cur.execute("SELECT COUNT(*) FROM jobs WHERE timestamp>=date('now','-7 day') AND cust_name=? "
+                                 "AND priority=?", (c, next_priority))
+            else:
+                self.cur.execute("SELECT COUNT(*) FROM jobs WHERE timestamp>=date('now','-7 day') AND cust_name=?",
+                                 (c,))
+            client_freq[c] = self.cur.fetchone()[0]
+
+        fewest = min(client_freq.values())
+        return [c for c in client_freq if client_freq[c] == fewest], next_priority
+
+    def get_next_priority(self):
+        priority_freq = {}
+
+        self.cur.execute("SELECT COUNT(*) FROM jobs WHERE timestamp>=date('now','-7 day')")
+        total_freq = self.cur.fetchone()[0]
+
+        self.cur.execute("SELECT priority from job_queue")
+        waiting_priorities = set([result[0] for result in self.cur.fetchall()])
+
+        for p in waiting_priorities:
+            self.cur.execute("SELECT COUNT(*) FROM jobs WHERE timestamp>=date('now','-7 day') AND priority=?", (p,))
+            count = self.cur.fetchone()[0]
+            priority_freq[p] = count / total_freq if count > 0 and total_freq > 0 else 0.0
+
+        return self.select_priority(sorted(waiting_priorities, reverse=True), priority_freq, PRIORITY_WEIGHTED)
+
+    def select_priority(self, waiting, priority_freq, priority_weighted, index=0):
+        if priority_freq[waiting[index]] < priority_weighted[waiting[index]]:
+            return waiting[index]
+        elif index == len(waiting) - 1:
+            return waiting[0]
+        return self.select_priority(waiting, priority_freq, priority_weighted, index + 1)
+
+    def oldest(self, where='', params=()):
+        """Gets the IDs of the oldest jobs matching a condition, all of which share a timestamp"""
+
+        self.cur.execute("SELECT id FROM job_queue WHERE datetime(timestamp)=(SELECT MIN(datetime(timestamp)) "
+                         "FROM job_queue {0}) {1}".format(where and 'WHERE ' + where, where and 'AND ' + where),
+                         params * 2)
+        return set(row[0] for row in self.cur.fetchall())
+
+    def select(self):
+        """Gets the IDs of the jobs the original selection could have chosen"""
+
+        if self.strategy == 0:
+            return self.oldest()
+        elif self.strategy == 2:
+            return self.oldest('priority=?', (self.get_next_priority(),))
+
+        clients, priority = self.get_next_clients(priority=self.strategy == 3)
+        candidates = set()
+        for client in clients:
+            if self.strategy == 1:
+                candidates |= self.oldest('cust_name=?', (client,))
+            else:
+                candidates |= self.oldest('cust_name=? AND priority=?', (client, priority))
+        return candidates
+
+    def claim(self, job_id):
+        self.cur.execute("INSERT INTO jobs SELECT * FROM job_queue WHERE id=?", (job_id,))
+        self.cur.execute("DELETE FROM job_queue WHERE id=?", (job_id,))
+
+
+def random_scenario(rng, now):
+    """Gets a random jobs history, reaching back past the fairness window, and job queue
+
+    Returns:
+        tuple: The jobs history records and the queued jobs
+
+    """
+
+    clients = ['client{}'.format(i) for i in range(rng.randint(1, 8))]
+
+    def job(job_id, age):
+        timestamp = (now - datetime.timedelta(seconds=age)).strftime('%Y-%m-%d %H:%M:%S')
+        return job_id, rng.choice(clients), '10.0.0.1', 8000, rng.randint(1, 3), timestamp, '22'
+
+    history = [job(job_id, rng.randint(0, 10 * 86400)) for job_id in range(1, rng.randint(1, 300))]
+
+    # timestamps are drawn from a small range so that some jobs share one
+    queued = [job(job_id, rng.randint(0, 300)) for job_id in range(1001, 1001 + rng.randint(1, 200))]
+    return history, queued
+
+
+@pytest.mark.parametrize('strategy', [0, 1, 2, 3])
+@pytest.mark.parametrize('seed', range(QUEUES))
+def test_policy_matches_sql(strategy, seed):
+    history, queued = random_scenario(random.Random(seed), datetime.datetime.utcnow())
+
+    db = sqlite3.connect(':memory:')
+    migrate(db)
+    cur = db.cursor()
+    cur.executemany("INSERT INTO jobs VALUES (?,?,?,?,?,?,?)", history)
+    cur.executemany("INSERT INTO job_queue VALUES (?,?,?,?,?,?,?)", queued)
+
+    # the policies are fed from the same tables the way the Scheduler is
+    fair_share = FairShare()
+    fair_share.rebuild(cur)
+    queue = JobQueue(fair_share)
+    queue.load(cur)
+    policy = get_policy(strategy)
+    reference = SqlSelection(cur, strategy)
+
+    with queue.lock:
+        for i in range(len(queued)):
+            candidates = reference.select()
+            job = queue.take(policy.select(queue, fair_share)[0])
+            assert job[0] in candidates, 'selection {} differs'.format(i)
+            reference.claim(job[0])
+
+    assert len(queue) == 0
+    db.close()
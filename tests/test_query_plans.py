@@ -0,0 +1,84 @@
+""" Query plan tests for the EFS database
+
+Checks with EXPLAIN QUERY PLAN that the statements run on the hot
+paths of the Scheduler and Monitor, all of which are defined in
+Database.py and FairShare.py, are served by an index or the primary
+key once the job queue holds 100k jobs, which is the default maxqueue.
+"""
+
+import re
+import sqlite3
+
+import pytest
+
+import Database
+import FairShare
+from Migrations import migrate
+
+QUEUED = 100000
+HISTORY = 100000
+
+TABLES = ('jobs', 'job_queue', 'term_queue', 'job_counts')
+
+DAY = '2026-01-01'
+
+# hot statements, taken from the modules which run them, along with example parameters,
+# the termination queue is listed in full by design so the listing is left out
+HOT_QUERIES = {
+    'queue job': (Database.SELECT_QUEUED_JOB, (5000,)),
+    'queue jobs': (Database.SELECT_QUEUED_JOBS, (5000, 5100)),
+    'dequeue job': (Database.DELETE_QUEUED_JOB, (5000,)),
+    'claim job': (Database.CLAIM_JOB, (5000,)),
+    'remove termination': (Database.DELETE_TERMINATION, (5000,)),
+    'history days': (Database.SELECT_HISTORY_DAYS, (DAY,)),
+    'history of a day': (Database.SELECT_HISTORY, (DAY, DAY)),
+    'roll up history': (Database.COUNT_HISTORY, (DAY, DAY)),
+    'delete history': (Database.DELETE_HISTORY, (DAY, DAY)),
+    'update job count': (Database.UPDATE_JOB_COUNT, (1, DAY, 'client1', 1)),
+    'fair share window': (FairShare.WINDOW_COUNTS, (DAY, DAY)),
+}
+
+
+@pytest.fixture(scope='module')
+def db(tmp_path_factory):
+    """A migrated database holding 100k queued jobs and 100k jobs history records"""
+
+    db = sqlite3.connect(str(tmp_path_factory.mktemp('db') / 'edge.db'))
+    migrate(db)
+    db.executemany("INSERT INTO job_queue (cust_name, cust_ip, cust_port, priority, timestamp, ports) "
+                   "VALUES (?,?,?,?,datetime('2026-01-01', ? || ' seconds'),?)",
+                   (('client{}'.format(i % 50), '10.0.0.1', 8000, i % 3 + 1, i, '22') for i in range(QUEUED)))
+    db.executemany("INSERT INTO jobs (cust_name, cust_ip, cust_port, priority, timestamp, ports) "
+                   "VALUES (?,?,?,?,datetime('2025-12-01', ? || ' seconds'),?)",
+                   (('client{}'.format(i % 50), '10.0.0.1', 8000, i % 3 + 1, i * 30, '22') for i in range(HISTORY)))
+    db.execute("INSERT INTO term_queue (job_id, reason) VALUES (?,?)", (5, 'Container Idle'))
+    db.commit()
+    yield db
+    db.close()
+
+
+def table_accesses(db, sql, params):
+    """Gets the steps of a query plan which read one of the EFS tables
+
+    Returns:
+        list: The table name and plan detail of each step
+
+    """
+
+    accesses = []
+    for row in db.execute("EXPLAIN QUERY PLAN " + sql, params):
+        match = re.match(r'(SCAN|SEARCH|USING ROWID SEARCH ON) (?:TABLE )?(\w+)', row[-1])
+        if match and match.group(2) in TABLES:
+            accesses.append((match.group(2), row[-1]))
+    return accesses
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(db, name):
+    sql, params = HOT_QUERIES[name]
+
+    accesses = table_accesses(db, sql, params)
+    assert accesses, '{} reads no table'.format(name)
+    for table, detail in accesses:
+        assert re.search(r'USING (COVERING INDEX|INDEX|INTEGER PRIMARY KEY|PRIMARY KEY)|USING ROWID', detail), \
+            '{} reads {} without an index: {}'.format(name, table, detail)